@@ -0,0 +1,250 @@
+'''
+ Golden Axe tools.
+
+ Copyright (c) 2021 ReWolf
+ http://blog.rewolf.pl/
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published
+ by the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from typing import BinaryIO, Iterator, Optional, Tuple
+import os
+import struct
+import zlib
+
+import gatypes
+
+# x, y, width, height
+Box = Tuple[int, int, int, int]
+
+
+def diffBox(previous: Optional[bytes], current: bytes, width: int,
+            height: int) -> Optional[Box]:
+    '''Smallest rectangle containing every pixel that differs between two
+    frames, the whole frame without previous, None when nothing changed.'''
+    if previous is None:
+        return 0, 0, width, height
+    top = bottom = -1
+    left = width
+    right = 0
+    for y in range(height):
+        row = current[y * width:(y + 1) * width]
+        old = previous[y * width:(y + 1) * width]
+        if row == old:
+            continue
+        if top < 0:
+            top = y
+        bottom = y
+        xor = int.from_bytes(row, 'big') ^ int.from_bytes(old, 'big')
+        left = min(left, width - 1 - (xor.bit_length() - 1) // 8)
+        right = max(right, width - ((xor & -xor).bit_length() - 1) // 8)
+    if top < 0:
+        return None
+    return left, top, right - left, bottom - top + 1
+
+
+def cropFrame(pixels: bytes, width: int, box: Box) -> bytes:
+    x, y, w, h = box
+    if x == 0 and w == width:
+        return pixels[y * width:(y + h) * width]
+    return b''.join(pixels[row * width + x:row * width + x + w]
+                    for row in range(y, y + h))
+
+
+def gifLzw(data: bytes, min_code_size: int = 8) -> bytes:
+    '''GIF flavour of LZW, variable width codes packed LSB first.'''
+    clear = 1 << min_code_size
+    end = clear + 1
+    output = bytearray()
+    bits = 0
+    bit_count = 0
+    width = min_code_size + 1
+    next_code = end + 1
+    table = {}
+
+    # codes with their widths, packed into bytes at the end
+    codes = [clear]
+    widths = [width]
+    prefix = data[0] if data else -1
+    for c in data[1:]:
+        key = prefix << 8 | c
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+        codes.append(prefix)
+        widths.append(width)
+        if next_code < 4096:
+            table[key] = next_code
+            next_code += 1
+            if next_code > 1 << width and width < 12:
+                width += 1
+        else:
+            codes.append(clear)
+            widths.append(width)
+            table.clear()
+            next_code = end + 1
+            width = min_code_size + 1
+        prefix = c
+    if prefix >= 0:
+        codes.append(prefix)
+        widths.append(width)
+    codes.append(end)
+    widths.append(width)
+    for code, code_width in zip(codes, widths):
+        bits |= code << bit_count
+        bit_count += code_width
+        while bit_count >= 8:
+            output.append(bits & 0xFF)
+            bits >>= 8
+            bit_count -= 8
+    if bit_count:
+        output.append(bits)
+    return bytes(output)
+
+
+class GifWriter:
+    '''Streaming GIF89a writer. Frames share the palette as global color
+    table and only the changed rectangle of every frame is stored.'''
+
+    def __init__(self, f: BinaryIO, width: int, height: int, lut: bytes,
+                 loop: int = 0) -> None:
+        self.f = f
+        self.width = width
+        self.height = height
+        self.previous: Optional[bytes] = None
+        # global color table with 256 entries, no background, no aspect
+        f.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0xF7, 0, 0))
+        f.write(lut)
+        f.write(b'\x21\xFF\x0BNETSCAPE2.0\x03\x01' +
+                struct.pack('<H', loop) + b'\x00')
+
+    def addFrame(self, pixels: bytes, duration_ms: int) -> None:
+        box = diffBox(self.previous, pixels, self.width, self.height)
+        if box is None:
+            # a frame has to be there for its delay, one unchanged pixel
+            box = (0, 0, 1, 1)
+        self.previous = pixels
+        x, y, w, h = box
+        # graphic control extension, disposal: leave the frame in place
+        self.f.write(b'\x21\xF9\x04\x04' +
+                     struct.pack('<H', round(duration_ms / 10)) + b'\x00\x00')
+        self.f.write(b'\x2C' + struct.pack('<HHHHB', x, y, w, h, 0))
+        data = gifLzw(cropFrame(pixels, self.width, box))
+        self.f.write(b'\x08')
+        for pos in range(0, len(data), 255):
+            block = data[pos:pos + 255]
+            self.f.write(bytes((len(block), )) + block)
+        self.f.write(b'\x00')
+
+    def close(self) -> None:
+        self.f.write(b'\x3B')
+
+
+def pngChunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack(
+        '>I', zlib.crc32(chunk_type + data))
+
+
+class ApngWriter:
+    '''Streaming APNG writer with an indexed (PLTE) color type. The first
+    frame is also the default image, later ones only store the changed
+    rectangle. The frame count goes into the header, so it must be known
+    up front.'''
+
+    def __init__(self, f: BinaryIO, width: int, height: int, lut: bytes,
+                 frame_count: int, loop: int = 0) -> None:
+        self.f = f
+        self.width = width
+        self.height = height
+        self.sequence = 0
+        self.previous: Optional[bytes] = None
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(pngChunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3,
+                                              0, 0, 0)))
+        f.write(pngChunk(b'PLTE', lut))
+        f.write(pngChunk(b'acTL', struct.pack('>II', frame_count, loop)))
+
+    def __compress(self, pixels: bytes, width: int, height: int) -> bytes:
+        # filter type 0 for every row
+        compressor = zlib.compressobj(9)
+        data = [compressor.compress(b'\x00' + pixels[y * width:(y + 1) * width])
+                for y in range(height)]
+        data.append(compressor.flush())
+        return b''.join(data)
+
+    def addFrame(self, pixels: bytes, duration_ms: int) -> None:
+        box = diffBox(self.previous, pixels, self.width, self.height)
+        if box is None:
+            box = (0, 0, 1, 1)
+        first = self.previous is None
+        self.previous = pixels
+        x, y, w, h = box
+        # dispose: none, blend: source
+        self.f.write(pngChunk(b'fcTL', struct.pack(
+            '>IIIIIHHBB', self.sequence, w, h, x, y, duration_ms, 1000, 0, 0)))
+        self.sequence += 1
+        data = self.__compress(cropFrame(pixels, self.width, box), w, h)
+        if first:
+            self.f.write(pngChunk(b'IDAT', data))
+        else:
+            self.f.write(pngChunk(b'fdAT', struct.pack('>I', self.sequence) +
+                                  data))
+            self.sequence += 1
+
+    def close(self) -> None:
+        self.f.write(pngChunk(b'IEND', b''))
+
+
+def saveWebp(filename: str, frames: Iterator[bytes], width: int,
+             height: int, lut: bytes, duration_ms: int,
+             loop: int = 0) -> None:
+    '''Lossless animated WebP through Pillow.
+
+    Pillow wants all frames up front, so they are kept as indexed images of
+    a byte per pixel and only converted one at a time while encoding.'''
+    from PIL import Image
+
+    images = []
+    for pixels in frames:
+        img = Image.frombuffer('P', (width, height), pixels, 'raw', 'P', 0, 1)
+        img.putpalette(lut)
+        images.append(img)
+    if not images:
+        raise ValueError('no frames to export')
+    images[0].save(filename, 'WEBP', save_all=True,
+                   append_images=images[1:], lossless=True,
+                   duration=duration_ms, loop=loop)
+
+
+def exportAnimation(filename: str, frames: Iterator[bytes], frame_count: int,
+                    width: int, height: int, palette: gatypes.Palette,
+                    duration_ms: int, loop: int = 0) -> None:
+    '''Writes width x height indexed frames as GIF, APNG (.png) or WebP,
+    picked by the extension of filename.'''
+    extension = os.path.splitext(filename)[1].lower()
+    lut = palette.lut()
+    if extension == '.webp':
+        saveWebp(filename, frames, width, height, lut, duration_ms, loop)
+        return
+    if extension not in ('.gif', '.png'):
+        raise ValueError('unsupported animation format: %s' % filename)
+    with open(filename, 'wb') as f:
+        if extension == '.gif':
+            writer = GifWriter(f, width, height, lut, loop)
+        else:
+            writer = ApngWriter(f, width, height, lut, frame_count, loop)
+        for pixels in frames:
+            writer.addFrame(pixels, duration_ms)
+        writer.close()
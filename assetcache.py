@@ -0,0 +1,188 @@
+'''
+ Golden Axe tools.
+
+ Copyright (c) 2021 ReWolf
+ http://blog.rewolf.pl/
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published
+ by the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from typing import Dict, Optional
+import hashlib
+import os
+import tempfile
+
+import galzw
+
+
+def defaultCacheDirectory() -> str:
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'goldenaxe_explorer')
+
+
+class AssetCache:
+    '''On-disk cache of decompressed Galzw payloads.
+
+    Entries are keyed by the hash of the compressed bytes. Least recently
+    used entries are evicted above max_size, all of them are dropped when the
+    stored version differs from galzw.DECODER_VERSION. Other files in the
+    directory are left alone.
+
+    Several processes, e.g. the workers of a pool, can share the directory.
+    Entries are looked up on disk, and the total size is taken from a new
+    listing of the directory every SCAN_PUTS puts and before evicting.'''
+
+    VERSION_FILE = 'VERSION'
+    SUFFIX = '.bin'
+    TEMP_SUFFIX = '.tmp'
+    SCAN_PUTS = 32
+
+    def __init__(self, directory: str, max_size: int = 256 << 20,
+                 version: int = galzw.DECODER_VERSION) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self.version = str(version)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        if self.__readVersion() != self.version:
+            self.clear()
+        self.sizes: Dict[str, int] = {}
+        self.total_size = 0
+        self.puts = 0
+        self.__scan()
+
+    def __scan(self) -> None:
+        '''Sizes of all entries on disk, whoever wrote them.'''
+        self.sizes = {}
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.SUFFIX):
+                try:
+                    self.sizes[entry.name[:-len(self.SUFFIX)]] = \
+                        entry.stat().st_size
+                except FileNotFoundError:
+                    pass
+        self.total_size = sum(self.sizes.values())
+        self.puts = 0
+
+    def __readVersion(self) -> str:
+        try:
+            with open(os.path.join(self.directory, self.VERSION_FILE)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return ''
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def clear(self) -> None:
+        for fn in os.listdir(self.directory):
+            if fn.endswith((self.SUFFIX, self.TEMP_SUFFIX)):
+                try:
+                    os.remove(os.path.join(self.directory, fn))
+                except FileNotFoundError:
+                    pass
+        with open(os.path.join(self.directory, self.VERSION_FILE), 'w') as f:
+            f.write(self.version)
+        self.sizes = {}
+        self.total_size = 0
+
+    @staticmethod
+    def key(compressed_data: memoryview) -> str:
+        return hashlib.blake2b(compressed_data, digest_size=20).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.__path(key)
+        try:
+            with open(path, 'rb') as f:
+                # mtime is the LRU timestamp
+                os.utime(path)
+                data = f.read()
+        except OSError:
+            if key in self.sizes:
+                self.total_size -= self.sizes.pop(key)
+            return None
+        if key not in self.sizes:
+            # written by another process
+            self.sizes[key] = len(data)
+            self.total_size += len(data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_size:
+            return
+        fd, tmp_path = tempfile.mkstemp(suffix=self.TEMP_SUFFIX,
+                                        dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.__path(key))
+        self.total_size += len(data) - self.sizes.get(key, 0)
+        self.sizes[key] = len(data)
+        self.puts += 1
+        if self.puts >= self.SCAN_PUTS:
+            # count what the other processes wrote
+            self.__scan()
+        if self.total_size > self.max_size:
+            self.evict(self.max_size)
+
+    def evict(self, max_size: int) -> None:
+        '''Removes least recently used entries until max_size is met.'''
+        self.__scan()
+        entries = []
+        for key in self.sizes:
+            try:
+                entries.append((os.path.getmtime(self.__path(key)), key))
+            except OSError:
+                entries.append((0.0, key))
+        for _, key in sorted(entries):
+            if self.total_size <= max_size:
+                break
+            try:
+                os.remove(self.__path(key))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # still open somewhere (Windows), try again next time
+                continue
+            self.total_size -= self.sizes.pop(key)
+
+    def decode(self, compressed_data: memoryview) -> bytes:
+        key = self.key(compressed_data)
+        data = self.get(key)
+        if data is not None:
+            self.hits += 1
+            return data
+        self.misses += 1
+        data = galzw.Galzw().decode(compressed_data)
+        self.put(key, data)
+        return data
+
+
+default_cache: Optional[AssetCache] = None
+
+
+def setDefaultCache(cache: Optional[AssetCache]) -> None:
+    global default_cache
+    default_cache = cache
+
+
+class CachedGalzw:
+    '''Galzw through default_cache when one is set, the process of the
+    compressed data in goldenaxe.ksy and lzwfile.ksy.'''
+
+    def decode(self, compressed_data: memoryview) -> bytes:
+        if default_cache is None:
+            return galzw.Galzw().decode(compressed_data)
+        return default_cache.decode(compressed_data)
@@ -0,0 +1,214 @@
+'''
+ Golden Axe tools.
+
+ Copyright (c) 2021 ReWolf
+ http://blog.rewolf.pl/
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published
+ by the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Tuple
+import argparse
+import json
+import os
+import sys
+
+import gamefiles
+import gatypes
+import graph_util
+import parallel
+
+
+@dataclass
+class AtlasEntry:
+    filename: str
+    sprite: gatypes.SpriteDescriptor
+    x: int = 0
+    y: int = 0
+
+
+class Skyline:
+    '''Bottom-left skyline packer for a fixed width and unbounded height.
+
+    The skyline is a list of [x, y, width] segments covering the whole
+    width, every rectangle goes where its top edge ends up lowest.'''
+
+    def __init__(self, width: int) -> None:
+        self.width = width
+        self.height = 0
+        self.segments = [[0, 0, width]]
+
+    def __fit(self, index: int, width: int) -> int:
+        '''Returns the y a rectangle starting at segment index would rest at,
+        -1 if it sticks out on the right.'''
+        x = self.segments[index][0]
+        if x + width > self.width:
+            return -1
+        y = 0
+        remaining = width
+        while remaining > 0:
+            seg_y, seg_w = self.segments[index][1], self.segments[index][2]
+            if seg_y > y:
+                y = seg_y
+            remaining -= seg_w
+            index += 1
+        return y
+
+    def insert(self, width: int, height: int) -> Tuple[int, int]:
+        best_top = best_x = best_index = -1
+        best_y = 0
+        for index, (x, _, _) in enumerate(self.segments):
+            y = self.__fit(index, width)
+            if y < 0:
+                break
+            if best_index < 0 or y + height < best_top:
+                best_top, best_x, best_y, best_index = y + height, x, y, index
+        self.__place(best_index, best_x, best_y + height, width)
+        self.height = max(self.height, best_top)
+        return best_x, best_y
+
+    def __place(self, index: int, x: int, top: int, width: int) -> None:
+        # segments under the new rectangle are replaced by one at its top
+        end = x + width
+        last = index
+        while self.segments[last][0] + self.segments[last][2] < end:
+            last += 1
+        tail = self.segments[last]
+        tail_end = tail[0] + tail[2]
+        replacement = [[x, top, width]]
+        if tail_end > end:
+            replacement.append([end, tail[1], tail_end - end])
+        self.segments[index:last + 1] = replacement
+        # merge with neighbours at the same height
+        if index + 1 < len(self.segments) and \
+                self.segments[index + 1][1] == top:
+            self.segments[index][2] += self.segments.pop(index + 1)[2]
+        if index > 0 and self.segments[index - 1][1] == top:
+            self.segments[index - 1][2] += self.segments.pop(index)[2]
+
+
+class Atlas:
+    '''Sprites of one or more files packed into a single indexed buffer.'''
+
+    def __init__(self, width: int, height: int, pixels: bytearray,
+                 entries: List[AtlasEntry], background_index: int) -> None:
+        self.width = width
+        self.height = height
+        self.pixels = pixels
+        self.entries = entries
+        self.background_index = background_index
+
+    def manifest(self) -> Dict[str, Any]:
+        return {
+            'width': self.width,
+            'height': self.height,
+            'background_index': self.background_index,
+            'sprites': [self.manifestEntry(e) for e in self.entries],
+        }
+
+    @staticmethod
+    def manifestEntry(e: AtlasEntry) -> Dict[str, Any]:
+        entry = {
+            'file': os.path.basename(e.filename),
+            'id': e.sprite.id,
+            'x': e.x,
+            'y': e.y,
+            'width': e.sprite.width,
+            'height': e.sprite.height,
+        }
+        if e.sprite.header is not None:
+            # pixel_delta and the unknown, signed offset fields
+            entry.update(asdict(e.sprite.header))
+        return entry
+
+    def image(self, palette: gatypes.Palette):
+        img = graph_util.IndexedImage(self.pixels, self.width, self.height,
+                                      palette)
+        if self.background_index >= 0:
+            img.info[graph_util.BACKGROUND_INDEX] = self.background_index
+            graph_util.SetImagePalette(img, palette)
+        return img
+
+    def save(self, image_filename: str, manifest_filename: str,
+             palette: gatypes.Palette) -> None:
+        self.image(palette).save(image_filename)
+        with open(manifest_filename, 'w') as f:
+            json.dump(self.manifest(), f, indent=1)
+
+
+def buildAtlas(files: List[Tuple[str, List[gatypes.SpriteDescriptor]]],
+               max_width: int = 1024, padding: int = 0) -> Atlas:
+    '''Packs the sprites of (filename, sprites) pairs, tallest first.'''
+    entries = [AtlasEntry(fn, s) for fn, sprites in files for s in sprites]
+    width = max([max_width] +
+                [e.sprite.width + padding for e in entries])
+    packer = Skyline(width)
+    for e in sorted(entries,
+                    key=lambda e: (e.sprite.height, e.sprite.width),
+                    reverse=True):
+        if e.sprite.width and e.sprite.height:
+            e.x, e.y = packer.insert(e.sprite.width + padding,
+                                     e.sprite.height + padding)
+    height = max(packer.height - padding, 0)
+    background_index = graph_util.FreeColorIndex(
+        [e.sprite.data for e in entries])
+    pixels = bytearray((background_index if background_index >= 0 else 0xFF,
+                        )) * (width * height)
+    for e in entries:
+        w = e.sprite.width
+        if not w:
+            continue
+        data = e.sprite.data
+        pos = e.y * width + e.x
+        for row in range(0, w * e.sprite.height, w):
+            pixels[pos:pos + w] = data[row:row + w]
+            pos += width
+    return Atlas(width, height, pixels, entries, background_index)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Golden Axe sprite atlas')
+    parser.add_argument('spr_files', nargs='+')
+    parser.add_argument('-o', '--output', required=True, help='atlas image')
+    parser.add_argument('--manifest',
+                        help='JSON manifest, next to the image by default')
+    parser.add_argument('--width', type=int, default=1024)
+    parser.add_argument('--padding', type=int, default=0)
+    parser.add_argument('--palette', type=int,
+                        help='index in pal.dat, picked from the colors '
+                        'used if omitted')
+    args = parser.parse_args()
+
+    errors: List[str] = []
+    with parallel.createExecutor() as executor:
+        decoded = parallel.decodeSprFiles(args.spr_files, executor, errors)
+    for error in errors:
+        print('skipped', error, file=sys.stderr)
+    atlas = buildAtlas(list(zip(args.spr_files, decoded)), args.width,
+                       args.padding)
+    pals = gamefiles.loadPalettes(
+        os.path.dirname(os.path.abspath(args.spr_files[0])))
+    sprites = [e.sprite for e in atlas.entries]
+    if args.palette is not None:
+        palette = pals[args.palette]
+    else:
+        palette = gamefiles.defaultPalette(pals, sprites)
+    manifest = args.manifest or os.path.splitext(args.output)[0] + '.json'
+    atlas.save(args.output, manifest, palette)
+    print('%d sprites, %dx%d' % (len(sprites), atlas.width, atlas.height))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,535 @@
+'''
+ Golden Axe tools.
+
+ Copyright (c) 2021 ReWolf
+ http://blog.rewolf.pl/
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published
+ by the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from typing import Callable, List, Tuple
+import argparse
+import itertools
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+import atlas
+import galzw
+import gapacker
+import gatypes
+import graph_util
+import maprender
+import parallel
+import pixeldecoder
+
+MAGIC = b'GOLDENAXE\x0c'
+
+
+def collectPayloads(game_dir: str) -> List[Tuple[str, bytes]]:
+    '''Returns compressed Galzw streams of all SPR/CHR/MAP files.'''
+    payloads = []
+    for fn in sorted(os.listdir(game_dir)):
+        ext = fn[-4:].lower()
+        with open(os.path.join(game_dir, fn), 'rb') as f:
+            data = f.read()
+        if ext == '.spr':
+            count, = struct.unpack_from('<H', data, 0)
+            for i in range(count):
+                offset, size = struct.unpack_from('<HH', data, 2 + i * 4)
+                if not size:
+                    continue
+                start = offset << 4
+                payloads.append(('%s#%d' % (fn, i),
+                                 data[start + 10:start + (size << 4)]))
+        elif ext in ('.chr', '.map') and data[:10] == MAGIC:
+            payloads.append((fn, data[10:]))
+    return payloads
+
+
+def measure(decode: Callable[[bytes], bytes],
+            payloads: List[Tuple[str, bytes]],
+            repeat: int) -> Tuple[float, List[bytes]]:
+    best = float('inf')
+    outputs: List[bytes] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = [decode(p) for _, p in payloads]
+        best = min(best, time.perf_counter() - start)
+    return best, outputs
+
+
+def benchDecoders(payloads: List[Tuple[str, bytes]], repeat: int) -> None:
+    engines = [
+        ('GalzwReference', lambda p: galzw.GalzwReference().decode(p)),
+        ('Galzw', lambda p: galzw.Galzw().decode(p)),
+    ]
+    compressed = sum(len(p) for _, p in payloads)
+    reference = None
+    for name, decode in engines:
+        elapsed, outputs = measure(decode, payloads, repeat)
+        if reference is None:
+            reference = outputs
+        for (fn, _), out, ref in zip(payloads, outputs, reference):
+            if out != ref:
+                print('%s: output differs for %s' % (name, fn))
+        decompressed = sum(len(o) for o in outputs)
+        print('%-15s %8.3fs %8.2f MB/s out %8.2f MB/s in' %
+              (name, elapsed, decompressed / elapsed / 1e6,
+               compressed / elapsed / 1e6))
+
+
+def benchEncoder(payloads: List[Tuple[str, bytes]], repeat: int) -> None:
+    raw = [galzw.Galzw().decode(p) for _, p in payloads]
+    elapsed, outputs = measure(lambda r: galzw.GalzwEncoder().encode(r),
+                               [('', r) for r in raw], repeat)
+    for (fn, _), out, r in zip(payloads, outputs, raw):
+        if galzw.Galzw().decode(out) != r:
+            print('GalzwEncoder: round trip differs for %s' % fn)
+    print('%-15s %8.3fs %8.2f MB/s in  ratio %.2f' %
+          ('GalzwEncoder', elapsed, sum(len(r) for r in raw) / elapsed / 1e6,
+           sum(len(r) for r in raw) / sum(len(o) for o in outputs)))
+
+
+def legacyPixelDecode(pixels: bytes) -> bytearray:
+    # Pixeldecoder.decode before the run based rewrite, which appends whole
+    # runs and sizes the output once at the end.
+    cur_off = 0
+    output = bytearray()
+    while cur_off < len(pixels):
+        if pixels[cur_off] < 0x80:
+            output.extend([pixels[cur_off + 1]]*pixels[cur_off])
+            cur_off += 2
+        else:
+            c = 256 - pixels[cur_off]
+            output.extend(
+                p if p else p for p in pixels[cur_off + 1:cur_off + 1 + c])
+            cur_off += 1 + c
+    return output
+
+
+def syntheticImage(width: int, height: int, rnd: random.Random) -> bytes:
+    '''Sprite-like pixels: transparent background, a few color bands and noise.'''
+    base = rnd.randrange(16) << 4
+    image = bytearray()
+    for y in range(height):
+        if y and rnd.random() < 0.5:
+            image += image[-width:]
+            continue
+        left = rnd.randrange(width // 4 + 1)
+        right = width - rnd.randrange(width // 4 + 1)
+        row = bytearray(left)
+        x = left
+        while x < right:
+            n = min(rnd.randrange(1, 12), right - x)
+            if rnd.random() < 0.9:
+                row += bytes((base | rnd.randrange(16), )) * n
+            else:
+                row += bytes(base | rnd.randrange(16) for _ in range(n))
+            x += n
+        row += bytes(width - len(row))
+        image += row
+    return bytes(image)
+
+
+def syntheticSprites(count: int, seed: int = 0) -> List[Tuple[int, bytes]]:
+    '''Returns (width * height, RLE pixels) pairs shaped like game sprites.'''
+    rnd = random.Random(seed)
+    sprites = []
+    for _ in range(count):
+        width = rnd.randrange(16, 96)
+        height = rnd.randrange(16, 96)
+        image = syntheticImage(width, height, rnd)
+        sprites.append((len(image), gapacker.encodePixels(image)))
+    return sprites
+
+
+def syntheticPayloads(sets: int, seed: int = 0) -> List[Tuple[str, bytes]]:
+    '''Compressed sprite sets, for benchmarking without the game files.'''
+    rnd = random.Random(seed)
+    payloads = []
+    for i in range(sets):
+        sprites = []
+        for _ in range(rnd.randrange(8, 40)):
+            width = rnd.randrange(16, 96)
+            height = rnd.randrange(16, 96)
+            sprites.append((width, height, 0,
+                            syntheticImage(width, height, rnd)))
+        sprite_set = gapacker.buildSpriteSet(sprites)
+        payloads.append(('synthetic#%d' % i,
+                         galzw.GalzwEncoder().encode(sprite_set)))
+    return payloads
+
+
+def benchPixels(count: int, repeat: int) -> None:
+    sprites = syntheticSprites(count)
+
+    def legacy(size: int, rle: bytes) -> bytearray:
+        out = legacyPixelDecode(rle)
+        if len(out) < size:
+            out.extend([0] * (size - len(out)))
+        return out
+
+    engines = [
+        ('legacy', legacy),
+        ('Pixeldecoder',
+         lambda size, rle: pixeldecoder.Pixeldecoder(0, size).decode(rle)),
+    ]
+    pixels = sum(size for size, _ in sprites)
+    reference = None
+    for name, decode in engines:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outputs = [decode(size, rle) for size, rle in sprites]
+            best = min(best, time.perf_counter() - start)
+        if reference is None:
+            reference = outputs
+        elif outputs != reference:
+            print('%s: output differs' % name)
+        print('%-15s %8.3fs %8.2f Mpixels/s' % (name, best, pixels / best / 1e6))
+
+
+# a file is addressed in 16 byte units by 16 bit offsets, about 1 MiB
+SYNTHETIC_SETS_PER_SPR = 8
+
+
+def syntheticSprFiles(directory: str, sets: int,
+                      seed: int = 0) -> List[str]:
+    '''Writes sets synthetic sprite sets spread over as many SPR files as
+    they need, returns the file names.'''
+    rnd = random.Random(seed)
+    sprite_sets = []
+    for _ in range(sets):
+        sprites = []
+        for _ in range(rnd.randrange(8, 40)):
+            width = rnd.randrange(16, 96)
+            height = rnd.randrange(16, 96)
+            sprites.append((width, height, 0,
+                            syntheticImage(width, height, rnd)))
+        sprite_sets.append(gapacker.buildSpriteSet(sprites))
+    filenames = []
+    for start in range(0, sets, SYNTHETIC_SETS_PER_SPR):
+        filename = os.path.join(directory, 'SYNTH%d.SPR' % len(filenames))
+        with open(filename, 'wb') as f:
+            f.write(gapacker.buildSprFile(
+                sprite_sets[start:start + SYNTHETIC_SETS_PER_SPR]))
+        filenames.append(filename)
+    return filenames
+
+
+def benchParallel(spr_filenames: List[str], repeat: int) -> None:
+    tasks = [t for fn in spr_filenames for t in parallel.spriteEntryTasks(fn)]
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        reference = [parallel.decodeSpriteEntry(t) for t in tasks]
+        best = min(best, time.perf_counter() - start)
+    pixels = sum(len(p) for _, p in reference)
+    print('%d entries, %d pixels' % (len(tasks), pixels))
+    print('%-15s %8.3fs' % ('serial', best))
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        with parallel.createExecutor(workers) as executor:
+            # warm up the pool, process start-up isn't what we measure
+            list(executor.map(int, range(workers)))
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                results = parallel.decodeSprFiles(spr_filenames, executor)
+                best = min(best, time.perf_counter() - start)
+        if [s.data for r in results for s in r] != [
+                s.data for s in parallel.toSpriteDescriptors(reference)]:
+            print('%d workers: output differs' % workers)
+        print('%-15s %8.3fs' % ('%d workers' % workers, best))
+        workers *= 2
+
+
+def legacyApplyPalette(buffer: bytearray, palette: gatypes.Palette) -> bytes:
+    # graph_util.ApplyPalette before the lookup table rewrite.
+    colors = [gatypes.Color(0, 0, 0)] * palette.palette_start_index
+    colors.extend(palette.colors)
+    colors.extend([gatypes.Color(0, 0, 0)] *
+                  (256 - palette.palette_start_index))
+    return bytes(
+        itertools.chain.from_iterable([colors[c].tuple() for c in buffer]))
+
+
+def benchPalette(map_width: int, map_height: int, repeat: int) -> None:
+    '''Colorizes every tile of a synthetic map, like Application.renderMap.'''
+    rnd = random.Random(0)
+    palette = gatypes.Palette(
+        [gatypes.Color(rnd.randrange(256), rnd.randrange(256),
+                       rnd.randrange(256)) for _ in range(16)], 0, 0x30)
+    tiles = [syntheticImage(8, 8, rnd) for _ in range(256)]
+    tiles = [bytearray(b & 0xF | 0x30 for b in t) for t in tiles]
+    cells = [tiles[rnd.randrange(len(tiles))]
+             for _ in range(map_width * map_height)]
+    engines = [
+        ('legacy', lambda: [legacyApplyPalette(c, palette) for c in cells]),
+        ('lut per tile',
+         lambda: [graph_util.ApplyPalette(c, palette) for c in cells]),
+    ]
+    pixels = len(cells) * 64
+    print('%dx%d tiles, %d pixels' % (map_width, map_height, pixels))
+    reference = None
+    for name, render in engines:
+        best = float('inf')
+        for _ in range(repeat):
+            # a palette switch drops the cached tables
+            palette.invalidate()
+            start = time.perf_counter()
+            outputs = render()
+            best = min(best, time.perf_counter() - start)
+        if reference is None:
+            reference = outputs
+        elif outputs != reference:
+            print('%s: output differs' % name)
+        print('%-15s %8.3fs %8.2f Mpixels/s' % (name, best, pixels / best / 1e6))
+    whole = bytearray(b''.join(cells))
+    best = float('inf')
+    for _ in range(repeat):
+        palette.invalidate()
+        start = time.perf_counter()
+        output = graph_util.ApplyPalette(whole, palette)
+        best = min(best, time.perf_counter() - start)
+    if output != b''.join(reference):
+        print('lut whole map: output differs')
+    print('%-15s %8.3fs %8.2f Mpixels/s' %
+          ('lut whole map', best, pixels / best / 1e6))
+
+
+def syntheticMap(map_width: int, map_height: int, tile_count: int,
+                 seed: int = 0) -> Tuple[bytes, List[int]]:
+    '''CHR tiles and MAP cells, a few cells point past the tile set.'''
+    rnd = random.Random(seed)
+    tiles = b''.join(
+        bytes(b & 0xF | 0x30 for b in syntheticImage(8, 8, rnd))
+        for _ in range(tile_count))
+    cells = [
+        rnd.randrange(32) << 11 | rnd.randrange(tile_count + 4) << 1
+        for _ in range(map_width * map_height)
+    ]
+    return tiles, cells
+
+
+def legacyRenderMap(tiles: bytes, cells: List[int], map_width: int,
+                    map_height: int, palette: gatypes.Palette) -> Image.Image:
+    # Application.renderMap before the compositor: one paste per cell.
+    tile_count = len(tiles) // 64
+    map_img = Image.new('RGB', (map_width * 8, map_height * 8),
+                        color=(255, 255, 255))
+    for y in range(map_height):
+        for x in range(map_width):
+            tile_index = (cells[y * map_width + x] & 0x07FF) >> 1
+            if tile_index >= tile_count:
+                tile_index = 0
+            colored_tile = legacyApplyPalette(
+                tiles[tile_index * 64:tile_index * 64 + 64], palette)
+            img = Image.frombuffer('RGB', (8, 8), colored_tile, 'raw', 'RGB',
+                                   0, 1)
+            map_img.paste(img, box=(x * 8, y * 8))
+    return map_img
+
+
+def benchMap(map_width: int, map_height: int, repeat: int) -> None:
+    rnd = random.Random(0)
+    palette = gatypes.Palette(
+        [gatypes.Color(rnd.randrange(256), rnd.randrange(256),
+                       rnd.randrange(256)) for _ in range(16)], 0, 0x30)
+    tiles, cells = syntheticMap(map_width, map_height, 1024)
+
+    def compose() -> Image.Image:
+        tile_set = maprender.TileSet(tiles)
+        map_image = maprender.composeMap(tile_set, cells, map_width,
+                                         map_height)
+        img = Image.frombuffer('P', (map_image.width, map_image.height),
+                               map_image.pixels, 'raw', 'P', 0, 1)
+        graph_util.SetImagePalette(img, palette)
+        return img
+
+    print('%dx%d tiles' % (map_width, map_height))
+    reference = None
+    for name, render in [('legacy', lambda: legacyRenderMap(
+            tiles, cells, map_width, map_height, palette)),
+                         ('composeMap', compose)]:
+        best = float('inf')
+        for _ in range(repeat):
+            palette.invalidate()
+            start = time.perf_counter()
+            output = render().convert('RGB').tobytes()
+            best = min(best, time.perf_counter() - start)
+        if reference is None:
+            reference = output
+        elif output != reference:
+            print('%s: output differs' % name)
+        print('%-15s %8.3fs' % (name, best))
+
+
+def benchAtlas(count: int, repeat: int) -> None:
+    rnd = random.Random(0)
+    sprites = []
+    for i in range(count):
+        width = rnd.randrange(16, 96)
+        height = rnd.randrange(16, 96)
+        sprites.append(gatypes.SpriteDescriptor(
+            i, width, height, 0, 0,
+            bytearray(syntheticImage(width, height, rnd))))
+    palette = gatypes.Palette([], 0)
+    used = sum(s.width * s.height for s in sprites)
+    print('%d sprites, %d pixels' % (count, used))
+
+    def packAtlas() -> Tuple[int, int]:
+        sheet = atlas.buildAtlas([('', sprites)])
+        return sheet.width, sheet.height
+
+    for name, build in [
+        ('GetSpritesImage',
+         lambda: graph_util.GetSpritesImage(sprites, palette).size),
+        ('buildAtlas', packAtlas),
+    ]:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            width, height = build()
+            best = min(best, time.perf_counter() - start)
+        print('%-15s %8.3fs %5dx%-6d fill %3.0f%%' %
+              (name, best, width, height, used * 100 / (width * height)))
+
+
+# name, modules imported together, modules they must not pull in
+IMPORT_TARGETS = [
+    ('core', ['galzw', 'bitreader', 'pixeldecoder', 'gatypes',
+              'goldenaxe_parser', 'lzwfile', 'palettes'],
+     ['PIL._imaging', '_tkinter', 'pkg_resources']),
+    ('worker', ['parallel', 'gamefiles'],
+     ['PIL._imaging', '_tkinter', 'pkg_resources']),
+    ('gui', ['tkgui'], ['PIL._imaging', 'pkg_resources']),
+]
+
+# run in a fresh interpreter, argv: modules, unwanted modules
+IMPORT_PROBE = '''
+import sys, time
+start = time.perf_counter()
+for name in sys.argv[1].split(','):
+    __import__(name)
+print(time.perf_counter() - start)
+print(','.join(m for m in sys.argv[2].split(',') if m in sys.modules))
+'''
+
+
+def measureImport(modules: List[str],
+                  unwanted: List[str]) -> Tuple[float, List[str]]:
+    '''Returns the import time of modules and the unwanted ones loaded.'''
+    output = subprocess.run(
+        [sys.executable, '-c', IMPORT_PROBE, ','.join(modules),
+         ','.join(unwanted)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True,
+        text=True, check=True).stdout.split('\n')
+    return float(output[0]), [m for m in output[1].split(',') if m]
+
+
+def benchImports(budget_ms: float, repeat: int) -> bool:
+    '''False if a target goes over budget or loads a module it shouldn't.'''
+    ok = True
+    for name, modules, unwanted in IMPORT_TARGETS:
+        best = float('inf')
+        for _ in range(repeat):
+            seconds, loaded = measureImport(modules, unwanted)
+            best = min(best, seconds)
+        status = 'ok'
+        if loaded:
+            status = 'loads ' + ', '.join(loaded)
+        elif best * 1000 > budget_ms:
+            status = 'over budget'
+        ok = ok and status == 'ok'
+        print('%-7s %8.1f ms  %s' % (name, best * 1000, status))
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Golden Axe decoder benchmarks')
+    parser.add_argument('--repeat', type=int, default=3)
+    commands = parser.add_subparsers(dest='command', required=True)
+    galzw_parser = commands.add_parser('galzw', help='LZW decoders')
+    galzw_parser.add_argument('game_dir', nargs='?',
+                              help='directory with SPR/CHR/MAP files, '
+                              'synthetic data is used if omitted')
+    galzw_parser.add_argument('--sets', type=int, default=20,
+                              help='number of synthetic sprite sets')
+    pixels_parser = commands.add_parser('pixels', help='sprite RLE decoders')
+    pixels_parser.add_argument('--sprites', type=int, default=500)
+    parallel_parser = commands.add_parser(
+        'parallel', help='process pool sprite decoding')
+    parallel_parser.add_argument('spr_files', nargs='*',
+                                 help='SPR files, a synthetic one is used '
+                                 'if omitted')
+    parallel_parser.add_argument('--sets', type=int, default=64,
+                                 help='entries of the synthetic SPR files')
+    palette_parser = commands.add_parser(
+        'palette', help='palette application on a full map')
+    palette_parser.add_argument('--width', type=int, default=256,
+                                help='map width in tiles')
+    palette_parser.add_argument('--height', type=int, default=32,
+                                help='map height in tiles')
+    map_parser = commands.add_parser('map', help='full map rendering')
+    map_parser.add_argument('--width', type=int, default=512,
+                            help='map width in tiles')
+    map_parser.add_argument('--height', type=int, default=64,
+                            help='map height in tiles')
+    atlas_parser = commands.add_parser('atlas', help='sprite sheet packing')
+    atlas_parser.add_argument('--sprites', type=int, default=3000)
+    imports_parser = commands.add_parser(
+        'imports', help='import time of the core, workers and the GUI')
+    imports_parser.add_argument('--budget-ms', type=float, default=150.0,
+                                help='fails when a group imports slower')
+    args = parser.parse_args()
+
+    if args.command == 'galzw':
+        if args.game_dir:
+            payloads = collectPayloads(args.game_dir)
+        else:
+            payloads = syntheticPayloads(args.sets)
+        print('%d streams, %d compressed bytes' %
+              (len(payloads), sum(len(p) for _, p in payloads)))
+        benchDecoders(payloads, args.repeat)
+        benchEncoder(payloads, args.repeat)
+    elif args.command == 'pixels':
+        benchPixels(args.sprites, args.repeat)
+    elif args.command == 'parallel':
+        if args.spr_files:
+            benchParallel(args.spr_files, args.repeat)
+        else:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                benchParallel(syntheticSprFiles(tmp_dir, args.sets),
+                              args.repeat)
+    elif args.command == 'palette':
+        benchPalette(args.width, args.height, args.repeat)
+    elif args.command == 'map':
+        benchMap(args.width, args.height, args.repeat)
+    elif args.command == 'atlas':
+        benchAtlas(args.sprites, args.repeat)
+    elif args.command == 'imports':
+        if not benchImports(args.budget_ms, args.repeat):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
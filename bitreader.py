@@ -18,6 +18,8 @@
  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
+from array import array
+
 
 def BitMask(n: int) -> int:
     return (1 << n) - 1
@@ -68,3 +70,113 @@ class BitReader:
                 return -1
             r |= (self.getBits(n - blen) << blen)
         return r
+
+
+class CodeReader(BitReader):
+    '''Bulk LZW code extractor on top of the "buggy" bit reader.
+
+    Follows the Galzw code width schedule (9 -> 12 bits, back to 9 bits and
+    cache reset on M_CLR), so whole streams can be turned into codes in one
+    pass. M_CLR codes are kept in the output, the code that follows M_CLR is
+    always data. With final cleared the reader never starts a code that could
+    hit the end of data, so it can be resumed after feed().'''
+
+    def __init__(self, data: memoryview, min_bits: int = 9,
+                 max_bits: int = 12) -> None:
+        super().__init__(data)
+        self.min_bits = min_bits
+        self.max_bits = max_bits
+        self.clear_code = 1 << (min_bits - 1)
+        self.req_bits = min_bits
+        self.next_code = self.clear_code + 1
+        self.next_shift = 1 << min_bits
+        self.first_code = True
+        self.after_clear = False
+        self.final = True
+
+    def feed(self, data: bytes, final: bool = False) -> None:
+        '''Appends data to the stream and drops the already consumed bytes.'''
+        if not isinstance(self.data, bytearray):
+            self.data = bytearray(self.data)
+        del self.data[:self.data_pos]
+        self.data_pos = 0
+        self.data += data
+        self.final = final
+
+    def readCodes(self, count: int = -1) -> array:
+        '''Reads up to count codes (all if negative), stops at the end of data.'''
+        codes = array('H')
+        append = codes.append
+        data = self.data
+        data_len = len(data)
+        data_pos = self.data_pos
+        bits = self.bits
+        bits_len = self.bits_len
+        req_bits = self.req_bits
+        next_code = self.next_code
+        next_shift = self.next_shift
+        max_bits = self.max_bits
+        clear_code = self.clear_code
+        max_code = 1 << max_bits
+        first_code = self.first_code
+        after_clear = self.after_clear
+        final = self.final
+
+        while count:
+            # Same as getBits(req_bits): every refill loads as many bytes as
+            # the bit count that is still requested at that recursion level.
+            n = req_bits
+            if not final and n > bits_len and data_len - data_pos < n:
+                break
+            code = 0
+            shift = 0
+            while n > bits_len:
+                code |= bits << shift
+                shift += bits_len
+                end = data_pos + n
+                if end > data_len:
+                    end = data_len
+                n -= bits_len
+                bits_len = (end - data_pos) << 3
+                if not bits_len:
+                    bits = 0
+                    data_pos = end
+                    count = 0
+                    break
+                bits = int.from_bytes(data[data_pos:end], 'little')
+                data_pos = end
+            if not count:
+                break
+            code |= (bits & ((1 << n) - 1)) << shift
+            bits >>= n
+            bits_len -= n
+            append(code)
+            count -= 1
+
+            if first_code:
+                first_code = False
+            elif code == clear_code and not after_clear:
+                bits = 0
+                bits_len = 0
+                req_bits = self.min_bits
+                next_code = clear_code
+                next_shift = 1 << req_bits
+                after_clear = True
+            else:
+                after_clear = False
+                if next_code < max_code:
+                    next_code += 1
+                    if next_code >= next_shift and req_bits < max_bits:
+                        req_bits += 1
+                        next_shift = 1 << req_bits
+
+        self.data_pos = data_pos
+        self.bits = bits
+        self.bits_len = bits_len
+        self.cache_size = req_bits
+        self.req_bits = req_bits
+        self.next_code = next_code
+        self.next_shift = next_shift
+        self.first_code = first_code
+        self.after_clear = after_clear
+        return codes
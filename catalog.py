@@ -0,0 +1,306 @@
+'''
+ Golden Axe tools.
+
+ Copyright (c) 2021 ReWolf
+ http://blog.rewolf.pl/
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published
+ by the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+import hashlib
+import json
+import mmap
+import os
+import re
+import tempfile
+
+import assetcache
+import galzw
+import gamefiles
+import goldenaxe_parser
+import lazylzwfile
+import maprender
+import memstream
+import parallel
+
+CATALOG_VERSION = 1
+
+SIZE_PATTERN = re.compile(r'(\d+|\*)x(\d+|\*)')
+
+
+@dataclass
+class SpriteInfo:
+    width: int
+    height: int
+    pixel_delta: int
+    # lowest color index used, -1 for an empty sprite
+    min_color: int
+
+
+@dataclass
+class EntryInfo:
+    '''One SPR entry, offset and size in bytes.'''
+    offset: int
+    size: int
+    # hash of the compressed data, same as the asset cache key
+    hash: str
+    sprites: List[SpriteInfo] = field(default_factory=list)
+
+
+@dataclass
+class FileInfo:
+    name: str
+    # 'spr', 'chr' or 'map'
+    kind: str
+    size: int
+    mtime_ns: int
+    hash: str
+    # palette start index the GUI picks for the whole file
+    palette_base: int = 0
+    entries: List[EntryInfo] = field(default_factory=list)
+    # CHR files, and MAP files through their CHR
+    tiles: int = 0
+    map_width: int = 0
+    map_height: int = 0
+    error: str = ''
+
+    def sprites(self) -> List[SpriteInfo]:
+        return [s for e in self.entries for s in e.sprites]
+
+    def spriteCount(self) -> int:
+        return sum(len(e.sprites) for e in self.entries) or self.tiles
+
+    def matches(self, query: str) -> bool:
+        '''Every word of query has to be part of the name, the kind or the
+        size of a sprite as WxH, * matching any width or height.'''
+        for word in query.lower().split():
+            if SIZE_PATTERN.fullmatch(word):
+                if not any(sizeMatches(word, s.width, s.height)
+                           for s in self.sprites()):
+                    return False
+            elif word != self.kind and word not in self.name.lower():
+                return False
+        return True
+
+    def toDict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        # plain lists, a big SPR file has thousands of sprites
+        for entry, info in zip(data['entries'], self.entries):
+            entry['sprites'] = [[s.width, s.height, s.pixel_delta, s.min_color]
+                                for s in info.sprites]
+        return data
+
+    @staticmethod
+    def fromDict(data: Dict[str, Any]) -> 'FileInfo':
+        data = dict(data)
+        entries = [
+            EntryInfo(e['offset'], e['size'], e['hash'],
+                      [SpriteInfo(*s) for s in e['sprites']])
+            for e in data.pop('entries')
+        ]
+        return FileInfo(entries=entries, **data)
+
+
+def sizeMatches(word: str, width: int, height: int) -> bool:
+    '''True if width x height fits a WxH word, * standing for any.'''
+    w, h = SIZE_PATTERN.fullmatch(word).groups()
+    return (w == '*' or int(w) == width) and (h == '*' or int(h) == height)
+
+
+def spriteMatches(query: str, sprite_id: int, width: int,
+                  height: int) -> bool:
+    '''Every word of query is a WxH size or a prefix of the hex id.'''
+    for word in query.lower().split():
+        if SIZE_PATTERN.fullmatch(word):
+            if not sizeMatches(word, width, height):
+                return False
+        elif not ('%06x' % sprite_id).startswith(word):
+            return False
+    return True
+
+
+def fileHash(path: str) -> str:
+    with open(path, 'rb') as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                return assetcache.AssetCache.key(memoryview(mapping))
+        except ValueError:
+            # empty files can't be mapped
+            return assetcache.AssetCache.key(memoryview(b''))
+
+
+def scanSprFile(info: FileInfo, path: str) -> None:
+    spr = memstream.parseMapped(goldenaxe_parser.GoldenaxeParser, path)
+    try:
+        for ss in spr.sprites:
+            if not ss.size:
+                continue
+            sprites = ss.data.sprite
+            # the compressed data is kept by the parser once data is read
+            entry = EntryInfo(ss.offset << 4, ss.size << 4,
+                              assetcache.AssetCache.key(ss._raw__raw__m_data))
+            for s in sprites:
+                data = s.sprite_data
+                entry.sprites.append(SpriteInfo(
+                    s.width, s.height, s.pixel_delta,
+                    min(data) if data else -1))
+            info.entries.append(entry)
+    finally:
+        spr._io.close()
+    info.palette_base = gamefiles.paletteBase(
+        s.min_color for s in info.sprites() if s.min_color >= 0)
+
+
+def scanChrFile(info: FileInfo, path: str) -> None:
+    tiles = gamefiles.loadTileSet(path)
+    info.tiles = len(tiles)
+    info.palette_base = gamefiles.paletteBase(
+        min(tiles.tile(i)) for i in range(len(tiles)))
+
+
+def scanMapFile(info: FileInfo, path: str) -> None:
+    # only the header is decompressed, tiles and palette come from the CHR
+    with lazylzwfile.LazyLzwfile.from_file(path) as mapfile:
+        info.map_width, info.map_height, _ = maprender.parseMap(
+            mapfile.peek(4))
+
+
+def scanFile(path: str) -> FileInfo:
+    '''Catalog entry of one game file, decodes all of it once. Errors are
+    recorded, so a broken file isn't scanned again until it changes.'''
+    stat = os.stat(path)
+    name = os.path.basename(path)
+    info = FileInfo(name, name[-3:].lower(), stat.st_size, stat.st_mtime_ns,
+                    fileHash(path))
+    try:
+        if info.kind == 'spr':
+            scanSprFile(info, path)
+        elif info.kind == 'chr':
+            scanChrFile(info, path)
+        else:
+            scanMapFile(info, path)
+    except Exception as e:
+        info.entries.clear()
+        info.error = '%s: %s' % (type(e).__name__, e)
+    return info
+
+
+def defaultCatalogPath(game_dir: str) -> str:
+    key = hashlib.blake2b(os.path.abspath(game_dir).encode(),
+                          digest_size=8).hexdigest()
+    return os.path.join(assetcache.defaultCacheDirectory(), 'catalog',
+                        key + '.json')
+
+
+class Catalog:
+    '''What is in every SPR, CHR and MAP file of a game directory, kept on
+    disk and rescanned per file when its size or mtime changes.
+
+    The file list comes from here, and the SPR entries let sprites be
+    decoded without parsing the file header again.'''
+
+    def __init__(self, game_dir: str, path: Optional[str] = None) -> None:
+        self.game_dir = game_dir
+        self.path = path or defaultCatalogPath(game_dir)
+        self.files: Dict[str, FileInfo] = {}
+        # every game file, in directory order, scanned or not
+        self.names: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def version(self) -> List[int]:
+        return [CATALOG_VERSION, galzw.DECODER_VERSION]
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != self.version() or \
+                data.get('game_dir') != os.path.abspath(self.game_dir):
+            return
+        self.files = {
+            f['name']: FileInfo.fromDict(f) for f in data.get('files', [])
+        }
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({
+                'version': self.version(),
+                'game_dir': os.path.abspath(self.game_dir),
+                'files': [info.toDict() for info in self.files.values()],
+            }, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def isCurrent(self, name: str) -> bool:
+        info = self.files.get(name)
+        if info is None:
+            return False
+        try:
+            stat = os.stat(os.path.join(self.game_dir, name))
+        except OSError:
+            return False
+        return info.size == stat.st_size and info.mtime_ns == stat.st_mtime_ns
+
+    def prune(self) -> List[str]:
+        '''Forgets deleted files and puts the rest in directory order, like
+        the plain file list. Returns the names of files to scan, which keep
+        their old entry until update() replaces it.'''
+        self.names = gamefiles.listGameFiles(self.game_dir)
+        old = self.files
+        self.files = {name: old[name] for name in self.names if name in old}
+        if len(self.files) != len(old):
+            self.linkMaps()
+        return [name for name in self.names if not self.isCurrent(name)]
+
+    def update(self, infos: Iterable[FileInfo]) -> None:
+        '''Stores entries scanned elsewhere, e.g. on a worker pool.'''
+        self.names = gamefiles.listGameFiles(self.game_dir)
+        for info in infos:
+            self.files[info.name] = info
+        self.files = {
+            name: self.files[name] for name in self.names
+            if name in self.files
+        }
+        self.linkMaps()
+
+    def linkMaps(self) -> None:
+        for info in self.files.values():
+            if info.kind != 'map':
+                continue
+            chr_info = self.files.get(gamefiles.chrFileForMap(info.name))
+            info.tiles = chr_info.tiles if chr_info else 0
+            info.palette_base = chr_info.palette_base if chr_info else 0
+
+    def search(self, query: str = '') -> List[FileInfo]:
+        '''Game files matching query, in directory order. A file not scanned
+        yet has a bare entry, matched by its name and kind only.'''
+        infos = [
+            self.files.get(name) or FileInfo(name, name[-3:].lower(), 0, 0, '')
+            for name in self.names
+        ]
+        return [info for info in infos if info.matches(query)]
+
+    def spriteEntryTasks(
+            self, info: FileInfo) -> List[parallel.SpriteEntryTask]:
+        '''Decode tasks of the entries of an SPR file, no header parsing.'''
+        path = os.path.join(self.game_dir, info.name)
+        return [(path, e.offset >> 4, e.size >> 4) for e in info.entries]
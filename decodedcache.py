@@ -0,0 +1,144 @@
+'''
+ Golden Axe tools.
+
+ Copyright (c) 2021 ReWolf
+ http://blog.rewolf.pl/
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published
+ by the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from dataclasses import dataclass, field
+from typing import List, Optional, Set, Tuple
+import os
+
+import gamefiles
+import lrucache
+import maprender
+import parallel
+
+# (path, size, mtime_ns), a changed file doesn't hit the old entry
+FileKey = Tuple[str, int, int]
+
+
+@dataclass
+class DecodedFile:
+    '''A whole game file decoded, all the GUI needs to show it.'''
+    # 'spr', 'chr' or 'map'
+    kind: str
+    # SPR files
+    entries: List[parallel.DecodedEntry] = field(default_factory=list)
+    # CHR files
+    tiles: Optional[maprender.TileSet] = None
+    # MAP files
+    game_map: Optional[gamefiles.GameMap] = None
+
+    def nbytes(self) -> int:
+        size = sum(len(pixels) for _, pixels in self.entries)
+        tiles = self.game_map.tiles if self.game_map else self.tiles
+        if tiles is not None:
+            # the data and the rows sliced from it
+            size += 2 * len(tiles.data)
+        if self.game_map is not None:
+            size += len(self.game_map.cells) * self.game_map.cells.itemsize
+        return size
+
+
+def fileKey(path: str) -> FileKey:
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+def decodeFile(path: str) -> DecodedFile:
+    '''Worker side: decodes all of an SPR, CHR or MAP file.'''
+    kind = path[-3:].lower()
+    if kind == 'spr':
+        return DecodedFile(kind, entries=[
+            parallel.decodeSpriteEntry(task)
+            for task in parallel.spriteEntryTasks(path)
+        ])
+    if kind == 'chr':
+        return DecodedFile(kind, tiles=gamefiles.loadTileSet(path))
+    return DecodedFile(kind, game_map=gamefiles.loadMapFile(path))
+
+
+def neighbours(index: int, count: int, distance: int) -> List[int]:
+    '''Indices up to distance around index in a list of count, nearest
+    first and the next one before the previous one.'''
+    result = []
+    for d in range(1, distance + 1):
+        result.extend(i for i in (index + d, index - d) if 0 <= i < count)
+    return result
+
+
+@dataclass
+class DecodedCacheStats(lrucache.LruCacheStats):
+    # files put by the prefetcher, the ones used and the ones evicted unused
+    prefetched: int = 0
+    prefetch_hits: int = 0
+    prefetch_wasted: int = 0
+
+    def prefetchHitRate(self) -> float:
+        '''Share of the prefetched files that were used.'''
+        return self.prefetch_hits / self.prefetched if self.prefetched else 0.0
+
+
+class DecodedCache(lrucache.LruCache):
+    '''LRU cache of decoded game files in memory, bounded by their bytes.
+
+    Entries put by a prefetcher are counted separately until first used, so
+    the stats tell how much of the reading ahead pays off.'''
+
+    def __init__(self, max_bytes: int = 128 << 20) -> None:
+        super().__init__(max_bytes)
+        self.stats = DecodedCacheStats()
+        # prefetched and not used yet
+        self.unused: Set[FileKey] = set()
+
+    def __str__(self) -> str:
+        return ('decoded cache: %d files, %d KiB, %d hits, %d misses '
+                '(%.0f%%), %d prefetched, %d used (%.0f%%), %d wasted' % (
+                    len(self.entries), self.size >> 10, self.stats.hits,
+                    self.stats.misses, self.stats.hitRate() * 100,
+                    self.stats.prefetched, self.stats.prefetch_hits,
+                    self.stats.prefetchHitRate() * 100,
+                    self.stats.prefetch_wasted))
+
+    def sizeOf(self, decoded: DecodedFile) -> int:
+        return decoded.nbytes()
+
+    def evicted(self, key: FileKey, decoded: DecodedFile) -> None:
+        if key in self.unused:
+            self.unused.remove(key)
+            self.stats.prefetch_wasted += 1
+
+    def get(self, key: FileKey) -> Optional[DecodedFile]:
+        decoded = super().get(key)
+        if decoded is not None and key in self.unused:
+            self.unused.remove(key)
+            self.stats.prefetch_hits += 1
+        return decoded
+
+    def put(self, key: FileKey, decoded: DecodedFile,
+            prefetched: bool = False) -> bool:
+        self.unused.discard(key)
+        if not super().put(key, decoded):
+            return False
+        if prefetched:
+            self.unused.add(key)
+            self.stats.prefetched += 1
+        return True
+
+    def clear(self) -> None:
+        super().clear()
+        self.unused.clear()
@@ -0,0 +1,199 @@
+'''
+ Golden Axe tools.
+
+ Copyright (c) 2021 ReWolf
+ http://blog.rewolf.pl/
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published
+ by the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from concurrent.futures import as_completed
+from dataclasses import dataclass, field
+from typing import List, Sequence
+import argparse
+import os
+import sys
+import time
+
+from PIL import Image
+
+import gamefiles
+import gatypes
+import graph_util
+import maprender
+import parallel
+
+# sprite sheet, one PNG per sprite, GIF animation, whole map
+OUTPUTS = ('sheet', 'sprites', 'gif', 'map')
+
+
+@dataclass
+class ExtractResult:
+    filename: str
+    input_size: int
+    sprites: int = 0
+    seconds: float = 0.0
+    # paths of the files written
+    outputs: List[str] = field(default_factory=list)
+    error: str = ''
+
+    def outputSize(self) -> int:
+        return sum(os.path.getsize(fn) for fn in self.outputs)
+
+
+def saveImage(img: Image.Image, filename: str,
+              result: ExtractResult) -> None:
+    img.save(filename)
+    result.outputs.append(filename)
+
+
+def extractSprites(sprites: List[gatypes.SpriteDescriptor],
+                   palette: gatypes.Palette, base: str,
+                   outputs: Sequence[str], fps: float,
+                   result: ExtractResult) -> None:
+    if 'sheet' in outputs:
+        saveImage(graph_util.GetSpritesImage(sprites, palette), base + '.png',
+                  result)
+    if 'sprites' in outputs:
+        os.makedirs(base, exist_ok=True)
+        for sprite in sprites:
+            if not sprite.width or not sprite.height:
+                continue
+            img = graph_util.SpriteImage(sprite)
+            graph_util.SetImagePalette(img, palette)
+            saveImage(img, os.path.join(base, '%06x.png' % sprite.id), result)
+    if 'gif' in outputs:
+        ok, error = graph_util.SaveAnimatedImage(base + '.gif', sprites,
+                                                 palette, fps)
+        if not ok:
+            raise ValueError(error)
+        result.outputs.append(base + '.gif')
+
+
+def extractMap(filename: str, pals: List[gatypes.Palette], base: str,
+               result: ExtractResult) -> None:
+    game_map = gamefiles.loadMapFile(filename)
+    if not len(game_map.tiles) or not game_map.width or not game_map.height:
+        return
+    palette = gamefiles.defaultPalette(
+        pals, gamefiles.tileSprites(game_map.tiles))
+    grid = game_map.grid()
+    img = graph_util.IndexedImage(
+        grid.compose(0, 0, grid.width, grid.height),
+        grid.width * maprender.TILE_SIZE, grid.height * maprender.TILE_SIZE,
+        palette)
+    saveImage(img, base + '.png', result)
+
+
+def extractFile(filename: str, output_dir: str,
+                pals: List[gatypes.Palette], outputs: Sequence[str],
+                fps: float) -> ExtractResult:
+    '''Worker side: writes the outputs of one game file, named after it.
+
+    SPR files give a sheet, per-sprite PNGs and a GIF, CHR files a tile
+    sheet and MAP files the whole map with the palette the GUI would pick.'''
+    start = time.perf_counter()
+    result = ExtractResult(filename, os.path.getsize(filename))
+    base = os.path.join(output_dir, os.path.basename(filename))
+    extension = os.path.splitext(filename)[1].lower()
+    try:
+        if extension == '.map':
+            if 'map' in outputs:
+                extractMap(filename, pals, base, result)
+        else:
+            if extension == '.spr':
+                sprites = gamefiles.loadSprFile(filename)
+            else:
+                sprites = gamefiles.loadChrFile(filename)
+                # single tiles and their "animation" aren't worth a file
+                outputs = [o for o in outputs if o == 'sheet']
+            result.sprites = len(sprites)
+            if sprites:
+                extractSprites(sprites, gamefiles.defaultPalette(pals, sprites),
+                               base, outputs, fps, result)
+    except Exception as e:
+        # one broken file shouldn't stop the batch
+        result.error = '%s: %s' % (type(e).__name__, e)
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def formatSize(size: float) -> str:
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return '%.1f %s' % (size, unit)
+        size /= 1024
+    return '%.1f GiB' % size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Extracts all graphics of a Golden Axe directory')
+    parser.add_argument('game_dir')
+    parser.add_argument('-o', '--output', required=True,
+                        help='output directory')
+    parser.add_argument('-f', '--formats', nargs='+', choices=OUTPUTS,
+                        default=list(OUTPUTS))
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='worker processes, all cores by default')
+    parser.add_argument('--fps', type=float, default=12.0,
+                        help='GIF animation speed')
+    parser.add_argument('--cache', help='asset cache directory shared by '
+                        'the workers, none by default')
+    args = parser.parse_args()
+
+    try:
+        pals = gamefiles.loadPalettes(args.game_dir)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    os.makedirs(args.output, exist_ok=True)
+    filenames = [os.path.join(args.game_dir, fn)
+                 for fn in gamefiles.listGameFiles(args.game_dir)]
+    # biggest first, so a large file doesn't end up alone at the end
+    filenames.sort(key=os.path.getsize, reverse=True)
+
+    start = time.perf_counter()
+    results: List[ExtractResult] = []
+    with parallel.createExecutor(args.jobs, args.cache) as executor:
+        futures = [
+            executor.submit(extractFile, fn, args.output, pals, args.formats,
+                            args.fps) for fn in filenames
+        ]
+        for future in as_completed(futures):
+            r = future.result()
+            results.append(r)
+            status = r.error or '%d sprites, %d files, %s' % (
+                r.sprites, len(r.outputs), formatSize(r.outputSize()))
+            print('[%*d/%d] %s: %s in %.2fs (%s/s) -> %s' % (
+                len(str(len(futures))), len(results), len(futures),
+                os.path.basename(r.filename), formatSize(r.input_size),
+                r.seconds, formatSize(r.input_size / max(r.seconds, 1e-9)),
+                status))
+    elapsed = time.perf_counter() - start
+
+    input_size = sum(r.input_size for r in results)
+    errors = sum(1 for r in results if r.error)
+    print('%d game files, %d sprites, %d outputs: %s in, %s out, %.2fs '
+          '(%s/s, %.0f sprites/s), %d errors' % (
+              len(results), sum(r.sprites for r in results),
+              sum(len(r.outputs) for r in results), formatSize(input_size),
+              formatSize(sum(r.outputSize() for r in results)), elapsed,
+              formatSize(input_size / max(elapsed, 1e-9)),
+              sum(r.sprites for r in results) / max(elapsed, 1e-9), errors))
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -18,13 +18,18 @@
  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
-from typing import DefaultDict
-from bitreader import BitReader
+from typing import DefaultDict, Dict, Iterator, List, Optional
+from array import array
+from bitreader import BitReader, CodeReader
 from collections import defaultdict
-import binascii
+import re
 
+# Bump whenever decoded output changes, invalidates assetcache entries.
+DECODER_VERSION = 1
 
-class Galzw:
+
+class GalzwReference:
+    '''Original per-bit Galzw decoder, kept as the reference for Galzw.'''
     flag90: bool
     decompressed: bytearray
 
@@ -43,7 +48,6 @@ class Galzw:
                 self.decompressed.extend([self.flag90data] * (byte-1))
 
     def decode(self, compressed_data: memoryview) -> bytes:
-        # print(binascii.hexlify(compressed_data))
         self.flag90 = False
         self.flag90data = -1
         self.decompressed = bytearray()
@@ -108,3 +112,338 @@ class Galzw:
 
             oldcode = incode
         return bytes(self.decompressed)
+
+
+class Rle90:
+    '''0x90 run-length stage, the second compression layer of Galzw.
+
+    Works on whole chunks of LZW output: bytes between 0x90 markers are copied
+    in bulk and only the marker pairs are expanded. State carries over between
+    chunks, so the output doesn't depend on how the input was split.'''
+
+    def __init__(self) -> None:
+        self.flag90 = False
+        self.flag90data = -1
+
+    def __expand(self, count: int, output: bytearray) -> None:
+        if count == 0:
+            output.append(0x90)
+        elif count > 1:
+            output += bytes((self.flag90data, )) * (count - 1)
+
+    def decode(self, data: bytes, output: bytearray) -> None:
+        '''Appends the expansion of data to output.'''
+        data_len = len(data)
+        pos = 0
+        if self.flag90 and data_len:
+            # marker pair split between chunks
+            self.flag90 = False
+            self.__expand(data[0], output)
+            pos = 1
+        while pos < data_len:
+            marker = data.find(0x90, pos)
+            if marker < 0:
+                output += data[pos:]
+                self.flag90data = data[-1]
+                break
+            if marker > pos:
+                output += data[pos:marker]
+                self.flag90data = data[marker - 1]
+            if marker + 1 == data_len:
+                self.flag90 = True
+                break
+            self.__expand(data[marker + 1], output)
+            pos = marker + 2
+
+
+class Galzw:
+    '''Table driven Galzw decoder.
+
+    Codes are extracted in bulk by CodeReader, the dictionary lives in flat
+    prefix/suffix arrays and the string of every code is cached as bytes, so
+    output is copied a whole string at a time. Output is byte-identical to
+    GalzwReference.decode, including the early exits.'''
+    rle: Rle90
+    decompressed: bytearray
+
+    C = 8
+    MAX_CODE_BITS = 12
+    M_CLR = 1 << C
+    TABLE_SIZE = 1 << MAX_CODE_BITS
+    CODES_WINDOW = 0x10000
+
+    def __walk(self, code: int) -> Optional[bytes]:
+        # Slow path for codes whose string may have changed since it was added
+        # (stale entries after M_CLR), mirrors the htab/d walk of the reference.
+        M_CLR = self.M_CLR
+        output = bytearray()
+        while code >= M_CLR:
+            if not self.present[code] or len(output) > self.TABLE_SIZE:
+                return None
+            output.append(self.suffix[code])
+            code = self.prefix[code]
+        output.append(code)
+        output.reverse()
+        return bytes(output)
+
+    def reset(self) -> None:
+        self.rle = Rle90()
+        self.decompressed = bytearray()
+
+        M_CLR = self.M_CLR
+        TABLE_SIZE = self.TABLE_SIZE
+        self.prefix = array('H', bytes(2 * TABLE_SIZE))
+        self.suffix = bytearray(TABLE_SIZE)
+        self.present = bytearray(TABLE_SIZE)
+        self.present[:M_CLR] = b'\x01' * M_CLR
+        # strings[code] is only set while the whole prefix chain of the code was
+        # added after the last M_CLR, so it can't be overwritten under us.
+        self.strings: List[Optional[bytes]] = [
+            bytes((i, )) for i in range(M_CLR)]
+        self.strings.extend([None] * (TABLE_SIZE - M_CLR))
+        self.next_code = M_CLR + 1
+        self.oldcode = -1
+        self.finchar = -1
+        self.after_clear = False
+
+    def decodeCodes(self, codes: array) -> bool:
+        '''Decodes a window of CodeReader codes, False on early exit.
+
+        LZW output of the window is collected first and then expanded by the
+        0x90 stage in one go.'''
+        M_CLR = self.M_CLR
+        TABLE_SIZE = self.TABLE_SIZE
+        prefix = self.prefix
+        suffix = self.suffix
+        present = self.present
+        strings = self.strings
+        next_code = self.next_code
+        oldcode = self.oldcode
+        finchar = self.finchar
+        after_clear = self.after_clear
+        raw = bytearray()
+
+        if oldcode < 0 and codes:
+            finchar = codes[0]
+            oldcode = finchar
+            raw.append(finchar)
+            codes = codes[1:]
+
+        ok = True
+        endless_loop = False
+        for cur_code in codes:
+            if cur_code == M_CLR and not after_clear:
+                next_code = M_CLR
+                strings[M_CLR:] = [None] * (TABLE_SIZE - M_CLR)
+                after_clear = True
+                continue
+            after_clear = False
+
+            incode = cur_code
+            if next_code <= cur_code:
+                string = strings[oldcode] or self.__walk(oldcode)
+                if string is None:
+                    ok = False
+                    break
+                string += bytes((finchar, ))
+            else:
+                string = strings[cur_code] or self.__walk(cur_code)
+                if string is None:
+                    ok = False
+                    break
+
+            finchar = string[0]
+            raw += string
+
+            if next_code < TABLE_SIZE:
+                prefix[next_code] = oldcode
+                suffix[next_code] = finchar
+                present[next_code] = 1
+                if next_code == oldcode:
+                    ok = False
+                    endless_loop = True
+                    break
+                old_string = strings[oldcode]
+                strings[next_code] = old_string + bytes(
+                    (finchar, )) if old_string is not None else None
+                next_code += 1
+
+            oldcode = incode
+
+        self.rle.decode(raw, self.decompressed)
+        if endless_loop:
+            print('endless loop ', next_code, hex(len(self.decompressed)))
+        self.next_code = next_code
+        self.oldcode = oldcode
+        self.finchar = finchar
+        self.after_clear = after_clear
+        return ok
+
+    def decode(self, compressed_data: memoryview) -> bytes:
+        self.reset()
+        br = CodeReader(compressed_data, self.C + 1, self.MAX_CODE_BITS)
+        codes = br.readCodes(self.CODES_WINDOW)
+        if not codes:
+            # the reference fails storing the missing first code
+            raise ValueError('no Galzw code in %d bytes' %
+                             len(compressed_data))
+        while codes and self.decodeCodes(codes):
+            codes = br.readCodes(self.CODES_WINDOW)
+        return bytes(self.decompressed)
+
+
+class GalzwStream(Galzw):
+    '''Resumable Galzw decoder.
+
+    Compressed data is passed in pieces with feed(), decompressed data is taken
+    with read() or iter_chunks(). Dictionary, bit reader and 0x90 state are kept
+    between calls, so callers can stop as soon as they have enough bytes.'''
+
+    READ_WINDOW = 0x400
+
+    def __init__(self) -> None:
+        self.reset()
+        self.reader = CodeReader(bytearray(), self.C + 1, self.MAX_CODE_BITS)
+        self.reader.final = False
+        self.finished = False
+
+    def feed(self, data: bytes, final: bool = False) -> None:
+        '''Appends compressed data, final marks the end of the stream.'''
+        self.reader.feed(data, final)
+
+    def read(self, n: int = -1) -> bytes:
+        '''Returns up to n decompressed bytes (all available if negative).
+
+        Fewer bytes are returned when more input has to be fed first, empty
+        result with finished set means the end of the stream.'''
+        out = self.decompressed
+        while (n < 0 or len(out) < n) and not self.finished:
+            codes = self.reader.readCodes(self.READ_WINDOW)
+            if not codes:
+                self.finished = self.reader.final
+                break
+            if not self.decodeCodes(codes):
+                self.finished = True
+        if n < 0 or n >= len(out):
+            chunk = bytes(out)
+            out.clear()
+        else:
+            chunk = bytes(out[:n])
+            del out[:n]
+        return chunk
+
+    def iter_chunks(self, chunk_size: int = 0x10000) -> Iterator[bytes]:
+        '''Yields everything that can be decoded from the data fed so far.'''
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+class GalzwEncoder:
+    '''Produces streams that Galzw.decode reads back unchanged.
+
+    Data is run-length coded with 0x90 markers and then LZW compressed with
+    the game's 9 -> 12 bit code growth. The dictionary is cleared (M_CLR) when
+    it's full; after every M_CLR the rest of the decoder's bit cache is padded
+    with zeros, because BitReader.clear() throws it away.'''
+
+    C = 8
+    MAX_CODE_BITS = 12
+    M_CLR = 1 << C
+    TABLE_SIZE = 1 << MAX_CODE_BITS
+    MIN_RUN = 4
+    MAX_REPEAT = 0xFF
+
+    def __encodeRle(self, data: bytes) -> bytes:
+        output = bytearray()
+        pos = 0
+        for run in re.finditer(rb'([^\x90])\1{%d,}' % (self.MIN_RUN - 1),
+                               data, re.S):
+            output += data[pos:run.start()].replace(b'\x90', b'\x90\x00')
+            output.append(data[run.start()])
+            # every marker pair repeats the last literal (count - 1) times
+            left = run.end() - run.start() - 1
+            while left:
+                count = min(left, self.MAX_REPEAT - 1)
+                output += bytes((0x90, count + 1))
+                left -= count
+            pos = run.end()
+        output += data[pos:].replace(b'\x90', b'\x90\x00')
+        return bytes(output)
+
+    def __encodeLzw(self, data: bytes) -> bytes:
+        output = bytearray()
+        if not data:
+            return bytes(output)
+        M_CLR = self.M_CLR
+        TABLE_SIZE = self.TABLE_SIZE
+        MAX_CODE_BITS = self.MAX_CODE_BITS
+        acc = 0
+        acc_bits = 0
+        # bits left in the decoder's cache, see BitReader.getBits
+        cache_bits = 0
+        req_bits = self.C + 1
+        # next_code as seen by the decoder, it lags one entry behind ours
+        next_code = M_CLR + 1
+        next_shift = 1 << req_bits
+        first_code = True
+        dictionary: Dict[int, int] = {}
+        dict_next = M_CLR + 1
+
+        def putCode(code: int) -> None:
+            nonlocal acc, acc_bits, cache_bits, req_bits, next_code
+            nonlocal next_shift, first_code
+            acc |= code << acc_bits
+            acc_bits += req_bits
+            if req_bits <= cache_bits:
+                cache_bits -= req_bits
+            else:
+                cache_bits = 8 * req_bits - (req_bits - cache_bits)
+            if acc_bits >= 32:
+                output.extend((acc & 0xFFFFFFFF).to_bytes(4, 'little'))
+                acc >>= 32
+                acc_bits -= 32
+            if code == M_CLR:
+                # skip what's left of the cache, it's dropped by the decoder
+                acc_bits += cache_bits
+                cache_bits = 0
+                req_bits = self.C + 1
+                next_code = M_CLR
+                next_shift = 1 << req_bits
+                while acc_bits >= 8:
+                    output.append(acc & 0xFF)
+                    acc >>= 8
+                    acc_bits -= 8
+            elif first_code:
+                first_code = False
+            elif next_code < TABLE_SIZE:
+                next_code += 1
+                if next_code >= next_shift and req_bits < MAX_CODE_BITS:
+                    req_bits += 1
+                    next_shift = 1 << req_bits
+
+        get = dictionary.get
+        w = data[0]
+        for c in data[1:]:
+            key = (w << 8) | c
+            code = get(key)
+            if code is not None:
+                w = code
+                continue
+            putCode(w)
+            if dict_next < TABLE_SIZE:
+                dictionary[key] = dict_next
+                dict_next += 1
+            else:
+                putCode(M_CLR)
+                dictionary.clear()
+                dict_next = M_CLR + 1
+            w = c
+        putCode(w)
+        output.extend(acc.to_bytes((acc_bits + 7) // 8, 'little'))
+        return bytes(output)
+
+    def encode(self, data: bytes) -> bytes:
+        return self.__encodeLzw(self.__encodeRle(data))
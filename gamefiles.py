@@ -0,0 +1,138 @@
+'''
+ Golden Axe tools.
+
+ Copyright (c) 2021 ReWolf
+ http://blog.rewolf.pl/
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published
+ by the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from array import array
+from dataclasses import dataclass
+from typing import Iterable, List
+import os
+
+import gatypes
+import goldenaxe_parser
+import graph_util
+import lazylzwfile
+import lzwfile
+import maprender
+import memstream
+import palettes
+
+SUPPORTED_EXTENSIONS = frozenset(['.spr', '.chr', '.map'])
+
+
+def isSupportedExt(filename: str) -> bool:
+    return filename[-4:].lower() in SUPPORTED_EXTENSIONS
+
+
+def listGameFiles(game_dir: str) -> List[str]:
+    '''Names of the SPR, CHR and MAP files in game_dir, in directory order.'''
+    (_, _, filenames) = next(os.walk(game_dir))
+    return [fn for fn in filenames if isSupportedExt(fn)]
+
+
+def loadPalettes(game_dir: str) -> List[gatypes.Palette]:
+    pal_dat = palettes.Palettes.from_file(os.path.join(game_dir, 'pal.dat'))
+    return [
+        gatypes.Palette([
+            gatypes.Color(int(c.r * graph_util.MULT), int(c.g * graph_util.MULT),
+                          int(c.b * graph_util.MULT)) for c in p.colors
+        ], i, p.palette_start_index) for i, p in enumerate(pal_dat.palettes)
+    ]
+
+
+def paletteBase(min_colors: Iterable[int]) -> int:
+    '''Palette start index for sprites with the given lowest colors.'''
+    return max(min_colors, default=0) & 0xF0
+
+
+def paletteStartIndex(sprites: List[gatypes.SpriteDescriptor]) -> int:
+    '''Palette start index the sprites' colors are drawn from.'''
+    return paletteBase(min(s.data) for s in sprites if s.data)
+
+
+def defaultPalette(pals: List[gatypes.Palette],
+                   sprites: List[gatypes.SpriteDescriptor]) -> gatypes.Palette:
+    '''First palette starting where the sprites' colors do, like the GUI.'''
+    start = paletteStartIndex(sprites)
+    for p in pals:
+        if p.palette_start_index == start:
+            return p
+    return gatypes.Palette([], 0)
+
+
+def loadSprFile(spr_filename: str) -> List[gatypes.SpriteDescriptor]:
+    '''Sprites of an SPR file, every entry is decompressed on first use.'''
+    spr = memstream.parseMapped(goldenaxe_parser.GoldenaxeParser, spr_filename)
+    sprites: List[gatypes.SpriteDescriptor] = []
+    for ss in spr.sprites:
+        if not ss.size:
+            continue
+        for s in ss.data.sprite:
+            sprites.append(gatypes.LazySpriteDescriptor(
+                len(sprites), s.width, s.height, 0, 0,
+                lambda s=s: s.sprite_data,
+                gatypes.SpriteHeader.fromBlob(s)))
+    return sprites
+
+
+def loadTileSet(chr_filename: str) -> maprender.TileSet:
+    chrfile = memstream.parseMapped(lzwfile.Lzwfile, chr_filename)
+    # the last complete tile of the CHR file is never used
+    tiles = maprender.TileSet(
+        chrfile.raw, max((len(chrfile.raw) - 1) // maprender.TILE_BYTES, 0))
+    chrfile._io.close()
+    return tiles
+
+
+def tileSprites(tiles: maprender.TileSet) -> List[gatypes.SpriteDescriptor]:
+    return [
+        gatypes.SpriteDescriptor(i, maprender.TILE_SIZE, maprender.TILE_SIZE,
+                                 0, 0, bytearray(tiles.tile(i)))
+        for i in range(len(tiles))
+    ]
+
+
+def loadChrFile(chr_filename: str) -> List[gatypes.SpriteDescriptor]:
+    '''Tiles of a CHR file as 8x8 sprites.'''
+    return tileSprites(loadTileSet(chr_filename))
+
+
+@dataclass
+class GameMap:
+    # in tiles
+    width: int
+    height: int
+    cells: array
+    # tiles of the CHR file next to the MAP file
+    tiles: maprender.TileSet
+
+    def grid(self) -> maprender.TileGrid:
+        return maprender.TileGrid(self.tiles, self.cells, self.width,
+                                  self.height)
+
+
+def chrFileForMap(map_filename: str) -> str:
+    return map_filename[:-4] + '.CHR'
+
+
+def loadMapFile(map_filename: str) -> GameMap:
+    with lazylzwfile.LazyLzwfile.from_file(map_filename) as mapfile:
+        width, height, _ = maprender.parseMap(mapfile.peek(4))
+        _, _, cells = maprender.parseMap(mapfile.peek(4 + width * height * 2))
+    tiles = loadTileSet(chrFileForMap(map_filename))
+    return GameMap(width, height, cells, tiles)
@@ -0,0 +1,95 @@
+'''
+ Golden Axe tools.
+
+ Copyright (c) 2021 ReWolf
+ http://blog.rewolf.pl/
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published
+ by the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from typing import List, Tuple
+import struct
+
+from galzw import GalzwEncoder
+
+MAGIC = b"\x47\x4F\x4C\x44\x45\x4E\x41\x58\x45\x0C"
+MAX_RUN = 0x7F
+
+
+def encodePixels(pixels: bytes) -> bytes:
+    '''RLE used by sprite blobs, reverse of Pixeldecoder.decode.'''
+    output = bytearray()
+    pos = 0
+    literal_start = 0
+    pixels_len = len(pixels)
+
+    def flushLiteral(end: int) -> None:
+        start = literal_start
+        while start < end:
+            count = min(end - start, MAX_RUN + 1)
+            output.append(256 - count)
+            output.extend(pixels[start:start + count])
+            start += count
+
+    while pos < pixels_len:
+        color = pixels[pos]
+        end = pos + 1
+        while end < pixels_len and end - pos < MAX_RUN and pixels[end] == color:
+            end += 1
+        if end - pos >= 3:
+            flushLiteral(pos)
+            output += bytes((end - pos, color))
+            literal_start = end
+        pos = end
+    flushLiteral(pixels_len)
+    return bytes(output)
+
+
+def buildSpriteSet(sprites: List[Tuple[int, int, int, bytes]]) -> bytes:
+    '''Builds a decompressed sprite set from (width, height, pixel_delta,
+    pixels) tuples, unknown header fields are zero.'''
+    output = bytearray(struct.pack('<HHH', 0xFFFF, len(sprites), 6))
+    for width, height, pixel_delta, pixels in sprites:
+        rle = encodePixels(pixels)
+        output += struct.pack('<HHBBBB24x', 32 + len(rle), width, height, 0,
+                              pixel_delta, 0)
+        output += rle
+    return bytes(output)
+
+
+def buildLzwFile(raw: bytes) -> bytes:
+    '''Builds a CHR/MAP file (see lzwfile.ksy).'''
+    return MAGIC + GalzwEncoder().encode(raw)
+
+
+def buildSprFile(sprite_sets: List[bytes]) -> bytes:
+    '''Builds an SPR file from decompressed sprite sets (see goldenaxe.ksy),
+    empty sets become zero sized entries.'''
+    header = bytearray(struct.pack('<H', len(sprite_sets)))
+    blocks = bytearray()
+    # blocks are addressed in 16 byte units
+    blocks_start = (2 + 4 * len(sprite_sets) + 15) & ~15
+    for sprite_set in sprite_sets:
+        if not sprite_set:
+            header += struct.pack('<HH', 0, 0)
+            continue
+        block = MAGIC + GalzwEncoder().encode(sprite_set)
+        block += bytes(-len(block) & 15)
+        offset = (blocks_start + len(blocks)) >> 4
+        if offset > 0xFFFF or len(block) >> 4 > 0xFFFF:
+            raise ValueError('SPR file too big')
+        header += struct.pack('<HH', offset, len(block) >> 4)
+        blocks += block
+    header += bytes(blocks_start - len(header))
+    return bytes(header + blocks)
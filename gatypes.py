@@ -18,8 +18,8 @@
  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
-from dataclasses import dataclass
-from typing import List, Tuple
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
 import struct
 
 STRUCT_USHORT_unpack = struct.Struct('<H').unpack
@@ -55,6 +55,55 @@ class Palette:
     colors: List[Color]
     index: int    
     palette_start_index: int = 0
+    _lut: Optional[bytes] = field(default=None, init=False, repr=False,
+                                  compare=False)
+    _channels: Optional[Tuple[bytes, bytes, bytes]] = field(
+        default=None, init=False, repr=False, compare=False)
+
+    def __setattr__(self, name: str, value) -> None:
+        if name in ('colors', 'palette_start_index'):
+            self.invalidate()
+        object.__setattr__(self, name, value)
+
+    def invalidate(self) -> None:
+        '''Drops the cached tables, needed after in-place edits of colors.'''
+        object.__setattr__(self, '_lut', None)
+        object.__setattr__(self, '_channels', None)
+
+    def lut(self) -> bytes:
+        '''256 RGB triplets, indices outside of the palette are black.'''
+        if self._lut is None:
+            lut = bytearray(256 * 3)
+            start = self.palette_start_index
+            for i, c in enumerate(self.colors[:max(256 - start, 0)]):
+                lut[(start + i) * 3:(start + i) * 3 + 3] = bytes(c.tuple())
+            object.__setattr__(self, '_lut', bytes(lut))
+        return self._lut
+
+    def channels(self) -> Tuple[bytes, bytes, bytes]:
+        '''Red, green and blue translation tables made from lut().'''
+        if self._channels is None:
+            lut = self.lut()
+            object.__setattr__(self, '_channels',
+                               (lut[0::3], lut[1::3], lut[2::3]))
+        return self._channels
+
+
+@dataclass
+class SpriteHeader:
+    '''Fields of the sprite_blob header in goldenaxe.ksy.'''
+    width: int
+    height: int
+    pixel_delta: int
+    unk07: int
+    unk08: int
+    unk11: int
+    unk12: int
+
+    @staticmethod
+    def fromBlob(blob) -> 'SpriteHeader':
+        return SpriteHeader(blob.width, blob.height, blob.pixel_delta,
+                            blob.unk07, blob.unk08, blob.unk11, blob.unk12)
 
 
 @dataclass
@@ -65,6 +114,36 @@ class SpriteDescriptor:
     x: int
     y: int
     data: bytearray
+    # None for sprites not read from an SPR file
+    header: Optional[SpriteHeader] = None
 
     def minColor(self) -> int:
         return min(self.data)
+
+
+class LazySpriteDescriptor(SpriteDescriptor):
+    '''SpriteDescriptor which calls loader on first access to data.'''
+
+    def __init__(self, id: int, width: int, height: int, x: int, y: int,
+                 loader: Callable[[], bytearray],
+                 header: Optional[SpriteHeader] = None) -> None:
+        self.id = id
+        self.width = width
+        self.height = height
+        self.x = x
+        self.y = y
+        self.header = header
+        self._loader: Optional[Callable[[], bytearray]] = loader
+        self._data = bytearray()
+
+    @property
+    def data(self) -> bytearray:
+        if self._loader is not None:
+            self._data = self._loader()
+            self._loader = None
+        return self._data
+
+    @data.setter
+    def data(self, data: bytearray) -> None:
+        self._loader = None
+        self._data = data
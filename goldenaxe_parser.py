@@ -1,13 +1,12 @@
 # This is a generated file! Please edit source .ksy file and use kaitai-struct-compiler to rebuild
 
-from pkg_resources import parse_version
 import kaitaistruct
 from kaitaistruct import KaitaiStruct, KaitaiStream, BytesIO
-from galzw import Galzw
+import assetcache
 from pixeldecoder import Pixeldecoder
 
 
-if parse_version(kaitaistruct.__version__) < parse_version('0.9'):
+if getattr(kaitaistruct, 'API_VERSION', (0, 9)) < (0, 9):
     raise Exception("Incompatible Kaitai Struct Python API: 0.9 or later is required, but you have %s" % (kaitaistruct.__version__))
 
 class GoldenaxeParser(KaitaiStruct):
@@ -54,7 +53,7 @@ class GoldenaxeParser(KaitaiStruct):
             _pos = self._io.pos()
             self._io.seek(((self.offset << 4) + 10))
             self._raw__raw__m_data = self._io.read_bytes(((self.size << 4) - 10))
-            _process = Galzw()
+            _process = assetcache.CachedGalzw()
             self._raw__m_data = _process.decode(self._raw__raw__m_data)
             _io__raw__m_data = KaitaiStream(BytesIO(self._raw__m_data))
             self._m_data = GoldenaxeParser.DecompressedSprite(_io__raw__m_data, self, self._root)
@@ -111,9 +110,43 @@ class GoldenaxeParser(KaitaiStruct):
             self.unk12 = self._io.read_s2le()
             self.unk13 = self._io.read_u2le()
             self.unk14 = self._io.read_u2le()
-            self._raw_sprite_data = self._io.read_bytes((self.sprite_data_size - 32))
-            _process = Pixeldecoder(self.pixel_delta)
-            self.sprite_data = _process.decode(self._raw_sprite_data)
+            self._raw_pixels = self._io.read_bytes((self.sprite_data_size - 32))
+            _io__raw_pixels = KaitaiStream(BytesIO(self._raw_pixels))
+            self.pixels = GoldenaxeParser.SpritePixels(self.pixel_delta, (self.width * self.height), _io__raw_pixels, self, self._root)
+
+        @property
+        def sprite_data(self):
+            if hasattr(self, '_m_sprite_data'):
+                return self._m_sprite_data if hasattr(self, '_m_sprite_data') else None
+
+            self._m_sprite_data = self.pixels.data
+            return self._m_sprite_data if hasattr(self, '_m_sprite_data') else None
+
+
+    class SpritePixels(KaitaiStruct):
+        def __init__(self, pixel_delta, sprite_size, _io, _parent=None, _root=None):
+            self._io = _io
+            self._parent = _parent
+            self._root = _root if _root else self
+            self.pixel_delta = pixel_delta
+            self.sprite_size = sprite_size
+            self._read()
+
+        def _read(self):
+            pass
+
+        @property
+        def data(self):
+            if hasattr(self, '_m_data'):
+                return self._m_data if hasattr(self, '_m_data') else None
+
+            _pos = self._io.pos()
+            self._io.seek(0)
+            self._raw__m_data = self._io.read_bytes_full()
+            _process = Pixeldecoder(self.pixel_delta, self.sprite_size)
+            self._m_data = _process.decode(self._raw__m_data)
+            self._io.seek(_pos)
+            return self._m_data if hasattr(self, '_m_data') else None
 
 
 
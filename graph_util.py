@@ -18,67 +18,155 @@
  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
+from __future__ import annotations
 from functools import cache
-from typing import List, Tuple
-from PIL import Image
-import itertools
+from typing import Iterator, List, Optional, Tuple
+import animexport
 import gatypes
+import lazyimport
+import rendercache
 
+# PIL loads on the first render, not when the module is imported
+Image = lazyimport.lazyImport('PIL.Image')
 
-def AddBorders(data: bytearray, width: int, height: int, left: int, right: int,
-               top: int, bottom: int, color: int) -> bytearray:
-    ret = bytearray()
-    for y in range(0, height):
-        ret.extend(bytearray([color] * left))
-        ret.extend(data[y * width:y * width + width])
-        ret.extend(bytearray([color] * right))
-    if top != 0:
-        tmp = bytearray([color] * ((width + left + right) * top))
-        tmp.extend(ret)
-        ret = tmp
-    if bottom != 0:
-        ret.extend(bytearray([color] * ((width + left + right) * bottom)))
-    return ret
+
+MULT = 255.0 / 63
 
 
-def AddClippingBox(sprite: gatypes.SpriteDescriptor,
-                   clipping_box: gatypes.ClippingBox, color: int) -> bytearray:
-    left_border = clipping_box.x_adjust - sprite.x
-    right_border = clipping_box.width - sprite.width - left_border
-    top_border = clipping_box.y_adjust - sprite.y
-    bottom_border = clipping_box.height - sprite.height - top_border
-    return AddBorders(sprite.data, sprite.width, sprite.height, left_border,
-                      right_border, top_border, bottom_border, color)
+def ApplyPalette(buffer: bytearray, palette: gatypes.Palette) -> bytes:
+    red, green, blue = palette.channels()
+    if not isinstance(buffer, (bytes, bytearray)):
+        buffer = bytes(buffer)
+    ret = bytearray(len(buffer) * 3)
+    ret[0::3] = buffer.translate(red)
+    ret[1::3] = buffer.translate(green)
+    ret[2::3] = buffer.translate(blue)
+    return bytes(ret)
 
 
-MULT = 255.0 / 63
+BACKGROUND_COLOR = (255, 255, 255)
+# info key of indexed images holding the palette slot used for the background
+BACKGROUND_INDEX = 'background_index'
 
 
-def ApplyPalette(buffer: bytearray, palette: gatypes.Palette) -> bytes:
-    colors = [gatypes.Color(0, 0, 0)] * palette.palette_start_index
-    colors.extend(palette.colors)
-    colors.extend([gatypes.Color(0, 0, 0)] *
-                  (256 - palette.palette_start_index))
-    return bytes(
-        itertools.chain.from_iterable([colors[c].tuple() for c in buffer]))
+def FreeColorIndex(buffers: List[bytes]) -> int:
+    '''Returns a color index not used by any of buffers, -1 if all are.'''
+    for index in range(0xFF, -1, -1):
+        needle = bytes((index, ))
+        if all(needle not in b for b in buffers):
+            return index
+    return -1
+
+
+def ImagePalette(palette: gatypes.Palette, background_index: int = -1) -> bytes:
+    lut = palette.lut()
+    if background_index < 0:
+        return lut
+    ret = bytearray(lut)
+    ret[background_index * 3:background_index * 3 + 3] = bytes(BACKGROUND_COLOR)
+    return bytes(ret)
+
+
+def SetImagePalette(img: Image.Image, palette: gatypes.Palette) -> None:
+    '''Recolors an indexed image, pixels stay untouched.'''
+    img.putpalette(ImagePalette(palette, img.info.get(BACKGROUND_INDEX, -1)))
+
+
+def IndexedImage(buffer: bytes, width: int, height: int,
+                 palette: gatypes.Palette) -> Image.Image:
+    img = Image.frombuffer('P', (width, height), bytes(buffer), 'raw', 'P', 0,
+                           1)
+    SetImagePalette(img, palette)
+    return img
+
+
+def SpriteImage(sprite: gatypes.SpriteDescriptor,
+                scale: float = 1.0) -> Image.Image:
+    '''Indexed image of a sprite without palette, scaled by scale.'''
+    img = Image.frombuffer('P', (sprite.width, sprite.height),
+                           bytes(sprite.data), 'raw', 'P', 0, 1)
+    if scale == 1.0:
+        return img
+    return img.resize((round(sprite.width * scale),
+                       round(sprite.height * scale)), Image.NEAREST)
+
+
+def CachedSpriteImage(cache: Optional[rendercache.RenderCache], filename: str,
+                      sprite: gatypes.SpriteDescriptor,
+                      scale: float = 1.0) -> Image.Image:
+    if cache is None:
+        return SpriteImage(sprite, scale)
+    return cache.image((filename, sprite.id, scale),
+                       lambda: SpriteImage(sprite, scale))
 
 
 def CalculateClippingBox(
         sprites: List[gatypes.SpriteDescriptor]) -> gatypes.ClippingBox:
-    min_x = min(sprites, key=lambda s: s.x).x
-    min_y = min(sprites, key=lambda s: s.y).y
-    max_x_w = max(sprites, key=lambda s: s.x + s.width)
-    max_y_h = max(sprites, key=lambda s: s.y + s.height)
-    width = max_x_w.x + max_x_w.width - min_x
-    height = max_y_h.y + max_y_h.height - min_y
-    x_adjust = max(sprites, key=lambda s: s.x).x
-    y_adjust = max(sprites, key=lambda s: s.y).y
-    return gatypes.ClippingBox(x_adjust, y_adjust, width, height)
+    first = sprites[0]
+    min_x = max_x = first.x
+    min_y = max_y = first.y
+    right = first.x + first.width
+    bottom = first.y + first.height
+    for s in sprites:
+        if s.x < min_x:
+            min_x = s.x
+        elif s.x > max_x:
+            max_x = s.x
+        if s.y < min_y:
+            min_y = s.y
+        elif s.y > max_y:
+            max_y = s.y
+        if s.x + s.width > right:
+            right = s.x + s.width
+        if s.y + s.height > bottom:
+            bottom = s.y + s.height
+    return gatypes.ClippingBox(max_x, max_y, right - min_x, bottom - min_y)
+
+
+class FrameSet:
+    '''Animation frames padded once to their clipping box, stored in one
+    contiguous buffer of len(sprites) x height x width color indices.'''
+
+    def __init__(self, sprites: List[gatypes.SpriteDescriptor],
+                 color: int = 0xFF) -> None:
+        self.box = CalculateClippingBox(sprites)
+        self.width = self.box.width
+        self.height = self.box.height
+        self.frame_size = self.width * self.height
+        self.count = len(sprites)
+        self.buffer = bytearray((color, )) * (self.count * self.frame_size)
+        for i, s in enumerate(sprites):
+            left = self.box.x_adjust - s.x
+            top = self.box.y_adjust - s.y
+            # parts sticking out of the box are cut off
+            src_x = max(-left, 0)
+            row_len = min(s.width, self.width - left) - src_x
+            data = s.data
+            base = i * self.frame_size + left + src_x
+            for y in range(max(-top, 0), min(s.height, self.height - top)):
+                pos = base + (top + y) * self.width
+                start = y * s.width + src_x
+                self.buffer[pos:pos + row_len] = data[start:start + row_len]
+        self.view = memoryview(self.buffer)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> memoryview:
+        if not 0 <= index < len(self):
+            raise IndexError('frame index out of range')
+        return self.view[index * self.frame_size:(index + 1) * self.frame_size]
+
+    def __iter__(self) -> Iterator[memoryview]:
+        for i in range(len(self)):
+            yield self[i]
 
 
 def GetSpritesImage(sprites: List[gatypes.SpriteDescriptor],
                     palette: gatypes.Palette,
-                    max_width: int = 1024) -> Image.Image:
+                    max_width: int = 1024,
+                    cache: Optional[rendercache.RenderCache] = None,
+                    filename: str = '') -> Image.Image:
     max_height = 0
     current_x = 0
     current_y = 0
@@ -89,11 +177,16 @@ def GetSpritesImage(sprites: List[gatypes.SpriteDescriptor],
         current_x += sprite.width
         if sprite.height > max_height:
             max_height = sprite.height
-    ret = Image.new("RGB", (
+    # white background needs a palette slot no sprite uses, when all 256 are
+    # taken the gaps get the color of 0xFF instead
+    background_index = FreeColorIndex([s.data for s in sprites])
+    ret = Image.new("P", (
         max_width,
         current_y + max_height,
     ),
-        color=(255, 255, 255))
+        color=background_index if background_index >= 0 else 0xFF)
+    if background_index >= 0:
+        ret.info[BACKGROUND_INDEX] = background_index
     max_height = 0
     current_x = 0
     current_y = 0
@@ -101,35 +194,21 @@ def GetSpritesImage(sprites: List[gatypes.SpriteDescriptor],
         if current_x + sprite.width > max_width:
             current_x = 0
             current_y += max_height
-        colored_sprite = ApplyPalette(sprite.data,
-                                      palette)
-        img = Image.frombuffer('RGB', (sprite.width, sprite.height),
-                               colored_sprite, 'raw', 'RGB', 0, 1)
-        ret.paste(img, box=(current_x, current_y))
+        ret.paste(CachedSpriteImage(cache, filename, sprite),
+                  box=(current_x, current_y))
         current_x += sprite.width
         if sprite.height > max_height:
             max_height = sprite.height
+    SetImagePalette(ret, palette)
     return ret
 
 
 def SaveAnimatedImage(filename: str, sprites: List[gatypes.SpriteDescriptor], palette: gatypes.Palette, speed: float) -> Tuple[bool, str]:
-    clipping_box = CalculateClippingBox(sprites)
-    images = []
-    for s in sprites:
-        buf = AddClippingBox(s, clipping_box, 0xFF)
-        colored_sprite = ApplyPalette(
-            buf, palette)
-        images.append(
-            Image.frombuffer('RGB',
-                             (clipping_box.width, clipping_box.height),
-                             colored_sprite, 'raw', 'RGB', 0, 1))
+    frames = FrameSet(sprites)
     try:
-        images[0].save(filename,
-                       save_all=True,
-                       append_images=images[1:],
-                       optimize=True,
-                       duration=round(1000 / speed),
-                       loop=0)
-    except ValueError as e:
+        animexport.exportAnimation(filename, iter(frames), len(frames),
+                                   frames.width, frames.height, palette,
+                                   round(1000 / speed))
+    except (ValueError, OSError) as e:
         return False, str(e)
     return True, ''
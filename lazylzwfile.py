@@ -0,0 +1,98 @@
+'''
+ Golden Axe tools.
+
+ Copyright (c) 2021 ReWolf
+ http://blog.rewolf.pl/
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published
+ by the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from typing import BinaryIO, Iterator
+import kaitaistruct
+from galzw import GalzwStream
+
+MAGIC = b"\x47\x4F\x4C\x44\x45\x4E\x41\x58\x45\x0C"
+
+
+class LazyLzwfile:
+    '''Lazy counterpart of lzwfile.Lzwfile.
+
+    The payload is only decompressed as far as it was requested, so e.g. the
+    MAP header can be read without decoding the rest of the file.'''
+
+    READ_SIZE = 0x4000
+
+    def __init__(self, f: BinaryIO) -> None:
+        self._f = f
+        self.magic = f.read(len(MAGIC))
+        if not self.magic == MAGIC:
+            raise kaitaistruct.ValidationNotEqualError(MAGIC, self.magic, None, u"/seq/0")
+        self._payload_pos = f.tell()
+        self._read_pos = self._payload_pos
+        self._stream = GalzwStream()
+        self._decoded = bytearray()
+
+    @classmethod
+    def from_file(cls, filename: str) -> 'LazyLzwfile':
+        f = open(filename, 'rb')
+        try:
+            return cls(f)
+        except Exception:
+            f.close()
+            raise
+
+    def close(self) -> None:
+        self._f.close()
+
+    def __enter__(self) -> 'LazyLzwfile':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __decodeTo(self, size: int) -> None:
+        stream = self._stream
+        while (size < 0 or len(self._decoded) < size) and not stream.finished:
+            chunk = stream.read(size - len(self._decoded) if size >= 0 else -1)
+            if chunk:
+                self._decoded += chunk
+            elif not stream.reader.final:
+                self._f.seek(self._read_pos)
+                data = self._f.read(self.READ_SIZE)
+                self._read_pos += len(data)
+                stream.feed(data, len(data) < self.READ_SIZE)
+
+    def peek(self, size: int) -> bytes:
+        '''Returns the first size bytes of the decompressed payload.'''
+        self.__decodeTo(size)
+        return bytes(self._decoded[:size])
+
+    @property
+    def raw(self) -> bytes:
+        '''Whole decompressed payload, same as Lzwfile.raw.'''
+        self.__decodeTo(-1)
+        return bytes(self._decoded)
+
+    def iter_chunks(self, chunk_size: int = 0x10000) -> Iterator[bytes]:
+        '''Streams the payload from the start without keeping it in memory.'''
+        pos = self._payload_pos
+        stream = GalzwStream()
+        while not stream.finished:
+            for chunk in stream.iter_chunks(chunk_size):
+                yield chunk
+            if not stream.reader.final:
+                self._f.seek(pos)
+                data = self._f.read(self.READ_SIZE)
+                pos += len(data)
+                stream.feed(data, len(data) < self.READ_SIZE)
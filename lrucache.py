@@ -0,0 +1,89 @@
+'''
+ Golden Axe tools.
+
+ Copyright (c) 2021 ReWolf
+ http://blog.rewolf.pl/
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published
+ by the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Hashable, Optional
+
+
+@dataclass
+class LruCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def hitRate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class LruCache:
+    '''LRU cache in memory, bounded by the bytes of its values.
+
+    Subclasses tell the size of a value in sizeOf(), evicted() is called for
+    every entry dropped to make room.'''
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.stats = LruCacheStats()
+        # key: (value, size)
+        self.entries: 'OrderedDict[Hashable, Any]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def sizeOf(self, value: Any) -> int:
+        raise NotImplementedError
+
+    def evicted(self, key: Hashable, value: Any) -> None:
+        pass
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> bool:
+        '''Returns False if value alone is bigger than max_bytes.'''
+        size = self.sizeOf(value)
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        if size > self.max_bytes:
+            return False
+        self.entries[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            old_key, (old, old_size) = self.entries.popitem(last=False)
+            self.size -= old_size
+            self.stats.evictions += 1
+            self.evicted(old_key, old)
+        return True
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
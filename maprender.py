@@ -0,0 +1,126 @@
+'''
+ Golden Axe tools.
+
+ Copyright (c) 2021 ReWolf
+ http://blog.rewolf.pl/
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published
+ by the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from array import array
+from dataclasses import dataclass, field
+from operator import itemgetter
+from typing import List, Optional, Sequence, Tuple
+import sys
+
+TILE_SIZE = 8
+TILE_BYTES = TILE_SIZE * TILE_SIZE
+
+
+def tileIndex(tile: int) -> int:
+    '''CHR tile number of a MAP cell, upper bits are cell attributes.'''
+    return (tile & 0x07FF) >> 1
+
+
+class TileSet:
+    '''CHR tiles as one buffer of consecutive 8x8 index tiles.'''
+
+    def __init__(self, data: bytes, count: Optional[int] = None) -> None:
+        if count is None:
+            count = len(data) // TILE_BYTES
+        self.count = count
+        self.data = bytes(data[:count * TILE_BYTES])
+        # rows[r][i] is pixel row r of tile i
+        self.rows = [[
+            self.data[i * TILE_BYTES + r * TILE_SIZE:i * TILE_BYTES +
+                      (r + 1) * TILE_SIZE] for i in range(count)
+        ] for r in range(TILE_SIZE)]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __reduce__(self) -> Tuple:
+        # rows are rebuilt on unpickling, not sent as thousands of slices
+        return TileSet, (self.data, self.count)
+
+    def tile(self, index: int) -> bytes:
+        return self.data[index * TILE_BYTES:(index + 1) * TILE_BYTES]
+
+
+@dataclass
+class MapImage:
+    width: int
+    height: int
+    pixels: bytes
+    # (x, y, tile index) of cells pointing past the tile set, drawn as tile 0
+    unknown_tiles: List[Tuple[int, int, int]] = field(default_factory=list)
+
+
+def parseMap(raw: bytes) -> Tuple[int, int, array]:
+    '''Returns width, height (in tiles) and the cells of a MAP payload.'''
+    header = array('H', bytes(raw[:4]))
+    if sys.byteorder == 'big':
+        header.byteswap()
+    width, height = header
+    cells = array('H', bytes(raw[4:4 + width * height * 2]))
+    if sys.byteorder == 'big':
+        cells.byteswap()
+    return width, height, cells
+
+
+class TileGrid:
+    '''MAP cells resolved against a tile set, any rectangle of tiles can be
+    composed on its own. Cells referencing unknown tiles use tile 0.'''
+
+    def __init__(self, tiles: TileSet, cells: Sequence[int], width: int,
+                 height: int) -> None:
+        if not len(tiles):
+            raise ValueError('empty tile set')
+        self.tiles = tiles
+        self.width = width
+        self.height = height
+        self.indices = [tileIndex(t) for t in cells]
+        # (x, y, tile index) of cells pointing past the tile set
+        self.unknown_tiles: List[Tuple[int, int, int]] = []
+        if any(i >= len(tiles) for i in self.indices):
+            for pos, i in enumerate(self.indices):
+                if i >= len(tiles):
+                    self.unknown_tiles.append((pos % width, pos // width, i))
+                    self.indices[pos] = 0
+
+    def compose(self, x: int, y: int, width: int, height: int) -> bytes:
+        '''Indexed pixels of the width x height tiles at tile x, y, clipped to
+        the grid by the caller.'''
+        if not width or not height:
+            return b''
+        rows = []
+        for row in range(y, y + height):
+            start = row * self.width + x
+            row_indices = self.indices[start:start + width]
+            if len(row_indices) == 1:
+                # itemgetter returns a bare item for a single index
+                rows.extend(r[row_indices[0]] for r in self.tiles.rows)
+                continue
+            getter = itemgetter(*row_indices)
+            rows.extend(b''.join(getter(r)) for r in self.tiles.rows)
+        return b''.join(rows)
+
+
+def composeMap(tiles: TileSet, cells: Sequence[int], width: int,
+               height: int) -> MapImage:
+    '''Gathers the tile rows of a width x height cell grid into one indexed
+    image, cells referencing unknown tiles are drawn with tile 0.'''
+    grid = TileGrid(tiles, cells, width, height)
+    return MapImage(width * TILE_SIZE, height * TILE_SIZE,
+                    grid.compose(0, 0, width, height), grid.unknown_tiles)
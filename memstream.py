@@ -0,0 +1,97 @@
+'''
+ Golden Axe tools.
+
+ Copyright (c) 2021 ReWolf
+ http://blog.rewolf.pl/
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published
+ by the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from typing import Optional, Type, TypeVar
+import io
+import mmap
+
+from kaitaistruct import KaitaiStream, KaitaiStruct
+
+
+class MemoryviewIO:
+    '''Read-only file object over a buffer, read() returns memoryview slices.
+
+    Used as KaitaiStream backend, so read_bytes() hands out views of the
+    underlying buffer instead of copies.'''
+
+    def __init__(self, buffer, owner: Optional[mmap.mmap] = None) -> None:
+        self.view = memoryview(buffer)
+        self.owner = owner
+        self.pos = 0
+
+    def read(self, n: int = -1) -> memoryview:
+        start = self.pos
+        if n < 0:
+            end = len(self.view)
+        else:
+            end = min(start + n, len(self.view))
+        self.pos = max(start, end)
+        return self.view[start:end]
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        if offset < 0:
+            raise ValueError('negative seek position %d' % offset)
+        self.pos = offset
+        return offset
+
+    def tell(self) -> int:
+        return self.pos
+
+    def seekable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        self.view.release()
+        if self.owner is not None:
+            try:
+                self.owner.close()
+            except BufferError:
+                # parsed objects still hold views, the mapping goes away
+                # together with them
+                pass
+
+
+def openMapped(filename: str) -> KaitaiStream:
+    '''KaitaiStream over a read-only memory mapping of filename.'''
+    with open(filename, 'rb') as f:
+        try:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            return KaitaiStream(MemoryviewIO(b''))
+    return KaitaiStream(MemoryviewIO(mapping, mapping))
+
+
+T = TypeVar('T', bound=KaitaiStruct)
+
+
+def parseMapped(cls: Type[T], filename: str) -> T:
+    '''Like cls.from_file(filename), but all byte fields are views of the
+    memory mapped file.'''
+    stream = openMapped(filename)
+    try:
+        return cls(stream)
+    except Exception:
+        stream.close()
+        raise
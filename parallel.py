@@ -0,0 +1,153 @@
+'''
+ Golden Axe tools.
+
+ Copyright (c) 2021 ReWolf
+ http://blog.rewolf.pl/
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published
+ by the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from io import BytesIO
+from typing import Any, Callable, List, Optional, Tuple
+import mmap
+import os
+
+from kaitaistruct import KaitaiStream
+
+import assetcache
+import gatypes
+import goldenaxe_parser
+import memstream
+
+# (path, offset, size) of one SPR entry, offset and size in 16 byte units
+SpriteEntryTask = Tuple[str, int, int]
+# header of every sprite and all their pixels concatenated
+DecodedEntry = Tuple[List[gatypes.SpriteHeader], bytes]
+
+
+def initWorker(cache_dir: Optional[str], nice: int = 0) -> None:
+    if cache_dir:
+        assetcache.setDefaultCache(assetcache.AssetCache(cache_dir))
+    if nice and hasattr(os, 'nice'):
+        os.nice(nice)
+
+
+def createExecutor(max_workers: Optional[int] = None,
+                   cache_dir: Optional[str] = None,
+                   nice: int = 0) -> ProcessPoolExecutor:
+    '''Process pool for the decode functions, workers share the asset cache
+    in cache_dir when given. A positive nice lowers the priority of the
+    workers where the OS supports it.'''
+    return ProcessPoolExecutor(max_workers=max_workers,
+                               initializer=initWorker,
+                               initargs=(cache_dir, nice))
+
+
+class WorkerError(Exception):
+    '''Error of a call run by call(), kept as its message.'''
+
+
+def call(function: Callable, *args: Any) -> Any:
+    '''Worker side: function(*args), errors re-raised as WorkerError.
+
+    Some exceptions can't be unpickled, kaitai's EndOfStreamError among
+    them, and one of those coming back breaks the whole pool.'''
+    try:
+        return function(*args)
+    except Exception as e:
+        raise WorkerError('%s: %s' % (type(e).__name__, e)) from None
+
+
+def spriteEntryTasks(spr_filename: str) -> List[SpriteEntryTask]:
+    '''Tasks for all non-empty entries of an SPR file, in file order.'''
+    spr = memstream.parseMapped(goldenaxe_parser.GoldenaxeParser, spr_filename)
+    tasks = [(spr_filename, s.offset, s.size) for s in spr.sprites if s.size]
+    spr._io.close()
+    return tasks
+
+
+def decodeSpriteEntry(task: SpriteEntryTask) -> DecodedEntry:
+    '''Worker side: decompresses one SPR entry and decodes all its pixels.'''
+    filename, offset, size = task
+    with open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            start = (offset << 4) + 10
+            # released before the mapping closes, also when decoding fails
+            with memoryview(mapping)[start:start + (size << 4) - 10] as \
+                    compressed:
+                raw = assetcache.CachedGalzw().decode(compressed)
+    sprite_set = goldenaxe_parser.GoldenaxeParser.DecompressedSprite(
+        KaitaiStream(BytesIO(raw)))
+    headers = [gatypes.SpriteHeader.fromBlob(s) for s in sprite_set.sprite]
+    pixels = b''.join(s.sprite_data for s in sprite_set.sprite)
+    return headers, pixels
+
+
+def toSpriteDescriptors(entries: List[DecodedEntry],
+                        first_id: int = 0) -> List[gatypes.SpriteDescriptor]:
+    sprites = []
+    for headers, pixels in entries:
+        pos = 0
+        for h in headers:
+            size = h.width * h.height
+            sprites.append(gatypes.SpriteDescriptor(
+                first_id + len(sprites), h.width, h.height, 0, 0,
+                bytearray(pixels[pos:pos + size]), h))
+            pos += size
+    return sprites
+
+
+def decodeSprFiles(
+        spr_filenames: List[str], executor: Executor,
+        errors: Optional[List[str]] = None
+) -> List[List[gatypes.SpriteDescriptor]]:
+    '''Decodes all sprites of all files, entries are spread over executor.
+
+    Result keeps the order of files and of sprites within every file. An
+    entry that fails to decode raises WorkerError, or with errors given its
+    sprites are left out and a message is added to errors, as are all of a
+    file whose header can't be read.'''
+    tasks: List[List[SpriteEntryTask]] = []
+    for fn in spr_filenames:
+        try:
+            tasks.append(spriteEntryTasks(fn))
+        except Exception as e:
+            if errors is None:
+                raise
+            errors.append('%s: %s: %s' % (fn, type(e).__name__, e))
+            tasks.append([])
+    flat = [t for file_tasks in tasks for t in file_tasks]
+    futures = [executor.submit(call, decodeSpriteEntry, t) for t in flat]
+    results: List[DecodedEntry] = []
+    for (filename, offset, _), future in zip(flat, futures):
+        try:
+            results.append(future.result())
+        except WorkerError as e:
+            if errors is None:
+                raise
+            errors.append('%s: entry at 0x%x: %s' % (filename, offset << 4,
+                                                      e))
+            results.append(([], b''))
+    decoded = iter(results)
+    return [
+        toSpriteDescriptors([next(decoded) for _ in file_tasks])
+        for file_tasks in tasks
+    ]
+
+
+def decodeSprFile(
+        spr_filename: str, executor: Executor,
+        errors: Optional[List[str]] = None) -> List[gatypes.SpriteDescriptor]:
+    return decodeSprFiles([spr_filename], executor, errors)[0]
@@ -1,19 +1,63 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class PixeldecoderStats:
+    '''Mismatch between the decoded pixels and the expected sprite size.'''
+    overrun: int = 0
+    underrun: int = 0
+    truncated_runs: int = 0
+
+
+class DecodedPixels(bytearray):
+    '''Decoded sprite pixels with the stats of their decoding, so they stay
+    reachable from the parsed sprite (sprite_data.stats).'''
+    stats: PixeldecoderStats
+
+
+FILL_BYTES = [bytes((i, )) for i in range(256)]
+
 
 class Pixeldecoder:
 
-    def __init__(self, delta: int) -> None:
+    def __init__(self, delta: int, size: int = -1) -> None:
         self.delta = delta
+        self.size = size
+        self.stats = PixeldecoderStats()
+
+    def decode(self, pixels: memoryview) -> DecodedPixels:
+        '''Decodes RLE pixels, with size set the output has exactly size bytes.
 
-    def decode(self, pixels: memoryview) -> bytearray:
+        Missing pixels are zero and extra pixels are dropped, both are counted
+        in stats, as is a run cut short by the end of the data.'''
+        output = DecodedPixels()
+        output.stats = self.stats
+        pixels_len = len(pixels)
         cur_off = 0
-        output = bytearray()
-        while cur_off < len(pixels):
-            if pixels[cur_off] < 0x80:
-                output.extend([pixels[cur_off + 1]]*pixels[cur_off])
-                cur_off += 2
-            else:
-                c = 256 - pixels[cur_off]
-                output.extend(
-                    p if p else p for p in pixels[cur_off + 1:cur_off + 1 + c])
-                cur_off += 1 + c
+        try:
+            while cur_off < pixels_len:
+                count = pixels[cur_off]
+                if count < 0x80:
+                    output += FILL_BYTES[pixels[cur_off + 1]] * count
+                    cur_off += 2
+                else:
+                    count = 256 - count
+                    cur_off += 1
+                    output += pixels[cur_off:cur_off + count]
+                    cur_off += count
+        except IndexError:
+            if self.size < 0:
+                raise
+            self.stats.truncated_runs += 1
+        if self.size < 0:
+            return output
+        if cur_off > pixels_len:
+            self.stats.truncated_runs += 1
+        size = self.size
+        if len(output) > size:
+            self.stats.overrun += len(output) - size
+            del output[size:]
+        else:
+            self.stats.underrun += size - len(output)
+            output += bytes(size - len(output))
         return output
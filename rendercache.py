@@ -0,0 +1,61 @@
+'''
+ Golden Axe tools.
+
+ Copyright (c) 2021 ReWolf
+ http://blog.rewolf.pl/
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published
+ by the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from __future__ import annotations
+from typing import Callable, Hashable, Tuple
+
+import lazyimport
+import lrucache
+
+Image = lazyimport.lazyImport('PIL.Image')
+
+# (file, sprite id or map block, scale)
+RenderKey = Tuple[str, Hashable, float]
+
+
+def imageBytes(img: Image.Image) -> int:
+    return img.width * img.height * len(img.getbands())
+
+
+class RenderCache(lrucache.LruCache):
+    '''LRU cache of finished scaled images, bounded by their pixel bytes.
+
+    Images are indexed, the palette is attached by whoever displays them,
+    so one entry serves every palette.'''
+
+    def __init__(self, max_bytes: int = 64 << 20) -> None:
+        super().__init__(max_bytes)
+
+    def __str__(self) -> str:
+        return 'render cache: %d entries, %d KiB, %d hits, %d misses (%.0f%%)' % (
+            len(self.entries), self.size >> 10, self.stats.hits,
+            self.stats.misses, self.stats.hitRate() * 100)
+
+    def sizeOf(self, img: Image.Image) -> int:
+        return imageBytes(img)
+
+    def image(self, key: RenderKey,
+              render: Callable[[], Image.Image]) -> Image.Image:
+        '''Cached image for key, render() builds it on a miss.'''
+        img = self.get(key)
+        if img is None:
+            img = render()
+            self.put(key, img)
+        return img
@@ -0,0 +1,155 @@
+'''
+ Golden Axe tools.
+
+ Copyright (c) 2021 ReWolf
+ http://blog.rewolf.pl/
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Lesser General Public License as published
+ by the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Lesser General Public License for more details.
+
+ You should have received a copy of the GNU Lesser General Public License
+ along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from contextlib import redirect_stdout
+from typing import List, Union
+import io
+import random
+import unittest
+
+import galzw
+
+
+def decodeOrError(decoder, data: bytes) -> Union[bytes, type]:
+    '''Output of decoder.decode, or the type of the exception it raised.'''
+    try:
+        # both decoders print on an endless loop
+        with redirect_stdout(io.StringIO()):
+            return decoder.decode(memoryview(data))
+    except Exception as e:
+        return type(e)
+
+
+def samplePayloads() -> List[bytes]:
+    '''Decompressed data shaped like the game's: runs, 0x90 bytes, a few
+    colors, and enough of it to fill the dictionary and clear it.'''
+    rnd = random.Random(0)
+    sprite = bytearray()
+    while len(sprite) < 20000:
+        sprite += bytes((rnd.randrange(16), )) * rnd.choice((1, 1, 2, 5, 40))
+    return [
+        b'A',
+        b'\x90',
+        b'\x90' * 10,
+        b'\x00' * 1000,
+        bytes(range(256)) * 4,
+        bytes(sprite),
+        bytes(rnd.randrange(256) for _ in range(30000)),
+        bytes(rnd.choice(b'\x00\x01\x90\xff') for _ in range(30000)),
+    ]
+
+
+class TestGalzw(unittest.TestCase):
+
+    def test_matches_reference(self) -> None:
+        for payload in samplePayloads():
+            compressed = galzw.GalzwEncoder().encode(payload)
+            self.assertEqual(
+                galzw.Galzw().decode(memoryview(compressed)),
+                galzw.GalzwReference().decode(memoryview(compressed)))
+
+    def test_edge_cases_match_reference(self) -> None:
+        compressed = galzw.GalzwEncoder().encode(samplePayloads()[5])
+        inputs = [b'', b'\x41', b'\x41\x00', b'\xff\xff']
+        # truncated streams
+        inputs += [compressed[:n] for n in range(1, 64)]
+        inputs += [compressed[:len(compressed) // 2], compressed[:-1]]
+        for data in inputs:
+            self.assertEqual(decodeOrError(galzw.Galzw(), data),
+                             decodeOrError(galzw.GalzwReference(), data),
+                             data[:8].hex())
+
+    def test_empty_input_raises(self) -> None:
+        for data in (b'', b'\x41'):
+            with self.assertRaises(ValueError):
+                galzw.Galzw().decode(memoryview(data))
+
+    def test_garbage_matches_reference(self) -> None:
+        # missing codes and endless loops end both decoders early
+        rnd = random.Random(1)
+        for _ in range(200):
+            data = bytes(
+                rnd.randrange(256) for _ in range(rnd.randrange(2, 400)))
+            self.assertEqual(decodeOrError(galzw.Galzw(), data),
+                             decodeOrError(galzw.GalzwReference(), data),
+                             data[:8].hex())
+
+
+def streamDecode(data: bytes, chunk_size: int, read_size: int) -> bytes:
+    '''GalzwStream output for data fed chunk_size bytes at a time and read
+    in read_size pieces after every feed.'''
+    stream = galzw.GalzwStream()
+    output = bytearray()
+    for pos in range(0, len(data), chunk_size):
+        stream.feed(data[pos:pos + chunk_size])
+        for chunk in stream.iter_chunks(read_size):
+            output += chunk
+    stream.feed(b'', final=True)
+    for chunk in stream.iter_chunks(read_size):
+        output += chunk
+    assert stream.finished
+    return bytes(output)
+
+
+class TestGalzwStream(unittest.TestCase):
+
+    def test_chunked_feed_matches_galzw(self) -> None:
+        for payload in samplePayloads():
+            compressed = galzw.GalzwEncoder().encode(payload)
+            # whole and truncated streams
+            for data in (compressed, compressed[:len(compressed) // 2 + 1]):
+                expected = galzw.Galzw().decode(memoryview(data))
+                for chunk_size, read_size in ((1, 7), (3, 1), (13, 0x400),
+                                              (len(data), 0x10000)):
+                    self.assertEqual(
+                        streamDecode(data, chunk_size, read_size), expected,
+                        (len(data), chunk_size, read_size))
+
+    def test_read_stops_early(self) -> None:
+        payload = samplePayloads()[5]
+        stream = galzw.GalzwStream()
+        stream.feed(galzw.GalzwEncoder().encode(payload), final=True)
+        self.assertEqual(stream.read(4), payload[:4])
+        self.assertFalse(stream.finished)
+        self.assertEqual(stream.read(), payload[4:])
+
+
+class TestGalzwEncoder(unittest.TestCase):
+
+    def test_round_trip(self) -> None:
+        payloads = samplePayloads() + [
+            # runs longer than one 0x90 marker pair repeats
+            b'\x07' * 254 + b'\x07' * 255 + b'\x90' * 300,
+            b'ab\x90\x00cd' * 100,
+        ]
+        for payload in payloads:
+            compressed = galzw.GalzwEncoder().encode(payload)
+            self.assertEqual(galzw.Galzw().decode(memoryview(compressed)),
+                             payload, len(payload))
+            self.assertEqual(
+                galzw.GalzwReference().decode(memoryview(compressed)),
+                payload, len(payload))
+
+    def test_runs_compress(self) -> None:
+        self.assertLess(len(galzw.GalzwEncoder().encode(bytes(100000))), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
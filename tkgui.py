@@ -18,28 +18,41 @@
  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
+from __future__ import annotations
+from concurrent.futures import Executor, Future
 from dataclasses import dataclass
+import logging
 import time
 import os
 import sys
 import tkinter as tk
 from tkinter import filedialog, messagebox
 
-from PIL import Image, ImageTk
-from threading import Thread
-from typing import Callable, List, Dict
+from typing import Callable, Hashable, Iterable, List, Dict, Optional, Tuple
 
 import pathlib
 
 import gatypes
 import graph_util
 
-import goldenaxe_parser
-import palettes
-import lzwfile
+import assetcache
+import catalog
+import decodedcache
+import gamefiles
+import lazyimport
+import maprender
+import parallel
+import rendercache
 
 from enum import Enum
 
+# the window comes up before PIL is loaded
+Image = lazyimport.lazyImport('PIL.Image')
+ImageTk = lazyimport.lazyImport('PIL.ImageTk')
+
+# load errors, and cache, canvas and load counts with GOLDENAXE_DEBUG set
+log = logging.getLogger('tkgui')
+
 
 class InputType(Enum):
     NONE = 0
@@ -131,12 +144,471 @@ class ControlFrame:
     def __init__(self, parent: tk.Frame, column: int, row: int):
         pass
 
-def isSupportedExt(filename: str) -> bool:
-    return filename[-4:].lower() in frozenset(['.spr', '.chr', '.map'])
+class CanvasLayer:
+    '''Image items on the canvas kept across renders, addressed by key.
+
+    Showing a key again updates the image and position of its item in
+    place. Hidden items are parked and handed out to the next new key,
+    trim() deletes the parked ones, so the item count follows what is on
+    screen rather than how many renders there were.'''
+
+    def __init__(self, canvas: tk.Canvas) -> None:
+        self.canvas = canvas
+        # key: [item, photo, x, y]
+        self.items: Dict[Hashable, List] = {}
+        self.spare: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __str__(self) -> str:
+        return 'canvas layer: %d items, %d spare, %d photos' % (
+            len(self.items), len(self.spare), self.photoCount())
+
+    def itemCount(self) -> int:
+        return len(self.items) + len(self.spare)
+
+    def photoCount(self) -> int:
+        return len(set(id(entry[1]) for entry in self.items.values()))
+
+    def photo(self, key: Hashable) -> Optional[ImageTk.PhotoImage]:
+        entry = self.items.get(key)
+        return entry[1] if entry else None
+
+    def show(self, key: Hashable, x: int, y: int,
+             photo: ImageTk.PhotoImage) -> int:
+        entry = self.items.get(key)
+        if entry is None and self.spare:
+            item = self.spare.pop()
+            self.canvas.coords(item, x, y)
+            self.canvas.itemconfigure(item, image=photo, state=tk.NORMAL)
+            entry = self.items[key] = [item, photo, x, y]
+        elif entry is None:
+            item = self.canvas.create_image(x, y, image=photo, anchor=tk.NW)
+            entry = self.items[key] = [item, photo, x, y]
+        else:
+            if entry[1] is not photo:
+                self.canvas.itemconfigure(entry[0], image=photo)
+                entry[1] = photo
+            if entry[2] != x or entry[3] != y:
+                self.canvas.coords(entry[0], x, y)
+                entry[2], entry[3] = x, y
+        return entry[0]
+
+    def hide(self, key: Hashable) -> None:
+        item = self.items.pop(key)[0]
+        # the photo is released with the entry, the item keeps no reference
+        self.canvas.itemconfigure(item, image='', state=tk.HIDDEN)
+        self.spare.append(item)
+
+    def retain(self, keys: Iterable[Hashable]) -> None:
+        '''Hides every item whose key is not in keys.'''
+        keys = set(keys)
+        for key in [k for k in self.items if k not in keys]:
+            self.hide(key)
+
+    def trim(self) -> None:
+        for item in self.spare:
+            self.canvas.delete(item)
+        self.spare.clear()
+
+    def clear(self) -> None:
+        self.retain(())
+        self.trim()
+
+
+class MapView:
+    '''Draws the part of a map visible on the canvas, in blocks of tiles.
+
+    Blocks intersecting the view are rendered right away, the ones around
+    them from idle callbacks. Blocks further away are dropped, so memory
+    follows the window size rather than map size and zoom.'''
+
+    # approximate on-screen size of a block
+    BLOCK_PIXELS = 256
+    # blocks around the view that are prefetched and kept
+    MARGIN = 1
+
+    def __init__(self, layer: CanvasLayer, grid: maprender.TileGrid,
+                 scale: float, palette: gatypes.Palette,
+                 cache: rendercache.RenderCache, filename: str) -> None:
+        self.canvas = layer.canvas
+        self.layer = layer
+        self.grid = grid
+        self.cache = cache
+        self.filename = filename
+        self.scale = scale
+        self.palette = palette
+        self.block_tiles = max(
+            1, round(self.BLOCK_PIXELS / (maprender.TILE_SIZE * scale)))
+        self.blocks_x = -(-grid.width // self.block_tiles)
+        self.blocks_y = -(-grid.height // self.block_tiles)
+        self.blocks: Dict[Tuple[int, int],
+                          Tuple[Image.Image, ImageTk.PhotoImage]] = {}
+        self.pending: List[Tuple[int, int]] = []
+        self.idle_job: Optional[str] = None
+        self.canvas.configure(scrollregion=(0, 0, self.toCanvas(grid.width),
+                                       self.toCanvas(grid.height)))
+
+    def toCanvas(self, tile: int) -> int:
+        return round(tile * maprender.TILE_SIZE * self.scale)
+
+    def visibleBlocks(self, margin: int) -> Tuple[range, range]:
+        block_size = self.block_tiles * maprender.TILE_SIZE * self.scale
+        left = self.canvas.canvasx(0)
+        top = self.canvas.canvasy(0)
+        right = left + self.canvas.winfo_width()
+        bottom = top + self.canvas.winfo_height()
+        return (range(max(int(left // block_size) - margin, 0),
+                      min(int(right // block_size) + 1 + margin,
+                          self.blocks_x)),
+                range(max(int(top // block_size) - margin, 0),
+                      min(int(bottom // block_size) + 1 + margin,
+                          self.blocks_y)))
+
+    def renderBlock(self, block_x: int, block_y: int) -> None:
+        img = self.cache.image(
+            (self.filename, ('map', self.block_tiles, block_x, block_y),
+             self.scale), lambda: self.blockImage(block_x, block_y))
+        graph_util.SetImagePalette(img, self.palette)
+        photo = ImageTk.PhotoImage(img)
+        self.layer.show((block_x, block_y),
+                        self.toCanvas(block_x * self.block_tiles),
+                        self.toCanvas(block_y * self.block_tiles), photo)
+        self.blocks[(block_x, block_y)] = (img, photo)
+
+    def blockImage(self, block_x: int, block_y: int) -> Image.Image:
+        tile_x = block_x * self.block_tiles
+        tile_y = block_y * self.block_tiles
+        tiles_w = min(self.block_tiles, self.grid.width - tile_x)
+        tiles_h = min(self.block_tiles, self.grid.height - tile_y)
+        img = Image.frombuffer(
+            'P', (tiles_w * maprender.TILE_SIZE, tiles_h * maprender.TILE_SIZE),
+            self.grid.compose(tile_x, tile_y, tiles_w, tiles_h), 'raw', 'P', 0,
+            1)
+        x = self.toCanvas(tile_x)
+        y = self.toCanvas(tile_y)
+        # edges come from the same rounding as the scroll region, no seams
+        return img.resize((self.toCanvas(tile_x + tiles_w) - x,
+                           self.toCanvas(tile_y + tiles_h) - y), Image.NEAREST)
+
+    def update(self) -> None:
+        '''Call after the view moved or the canvas was resized.'''
+        keep_x, keep_y = self.visibleBlocks(self.MARGIN)
+        for key in list(self.blocks):
+            if key[0] not in keep_x or key[1] not in keep_y:
+                # the item goes to the next block rendered
+                del self.blocks[key]
+                self.layer.hide(key)
+        visible_x, visible_y = self.visibleBlocks(0)
+        for block_y in visible_y:
+            for block_x in visible_x:
+                if (block_x, block_y) not in self.blocks:
+                    self.renderBlock(block_x, block_y)
+        self.pending = [(block_x, block_y) for block_y in keep_y
+                        for block_x in keep_x
+                        if (block_x, block_y) not in self.blocks]
+        if self.pending and self.idle_job is None:
+            self.idle_job = self.canvas.after_idle(self.renderPending)
+        elif not self.pending:
+            self.layer.trim()
+
+    def renderPending(self) -> None:
+        # one block per idle callback, so scrolling stays responsive
+        self.idle_job = None
+        while self.pending:
+            key = self.pending.pop()
+            if key not in self.blocks:
+                self.renderBlock(*key)
+                break
+        if self.pending:
+            self.idle_job = self.canvas.after_idle(self.renderPending)
+        else:
+            self.layer.trim()
+
+    def setPalette(self, palette: gatypes.Palette) -> None:
+        self.palette = palette
+        for img, photo in self.blocks.values():
+            graph_util.SetImagePalette(img, palette)
+            photo.paste(img)
+
+    def image(self) -> Image.Image:
+        '''Whole map at the current scale, for saving.'''
+        img = Image.frombuffer(
+            'P', (self.grid.width * maprender.TILE_SIZE,
+                  self.grid.height * maprender.TILE_SIZE),
+            self.grid.compose(0, 0, self.grid.width, self.grid.height), 'raw',
+            'P', 0, 1).resize((self.toCanvas(self.grid.width),
+                               self.toCanvas(self.grid.height)), Image.NEAREST)
+        graph_util.SetImagePalette(img, self.palette)
+        return img
+
+    def destroy(self) -> None:
+        '''Parks the items of the blocks, a following view reuses them.'''
+        if self.idle_job is not None:
+            self.canvas.after_cancel(self.idle_job)
+            self.idle_job = None
+        self.layer.retain(())
+        self.blocks.clear()
+        self.pending.clear()
+
+
+class AnimationPlayer:
+    '''Shows pre-rendered frames from the Tk event loop.
+
+    Frame n is due at start + n / fps. A late tick shows the frame due now
+    and counts the skipped ones as dropped, so playback keeps its speed
+    under load instead of drifting.'''
+
+    STATS_INTERVAL = 0.5
+
+    def __init__(self, layer: CanvasLayer, fps: Callable[[], float],
+                 on_stats: Callable[[str], None]) -> None:
+        self.canvas = layer.canvas
+        self.layer = layer
+        self.fps = fps
+        self.on_stats = on_stats
+        self.photos: List[ImageTk.PhotoImage] = []
+        self.render_cost = 0.0
+        self.job: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self.job is not None
+
+    def setFrames(self, photos: List[ImageTk.PhotoImage],
+                  render_cost: float) -> None:
+        '''render_cost is the time it took to render all photos.'''
+        self.photos = photos
+        self.render_cost = render_cost / len(photos)
+        if self.running:
+            self.showFrame(self.position)
+
+    def showFrame(self, position: int) -> None:
+        self.layer.show('frame', 0, 0, self.photos[position % len(self.photos)])
+
+    def start(self) -> None:
+        self.stop()
+        self.showFrame(0)
+        self.position = 0
+        self.rate = self.fps()
+        self.start_time = time.perf_counter()
+        self.dropped = 0
+        self.show_cost = 0.0
+        self.window_start = self.start_time
+        self.window_shown = 0
+        self.schedule()
+
+    def stop(self) -> None:
+        if self.job is not None:
+            self.canvas.after_cancel(self.job)
+            self.job = None
+        self.layer.clear()
+
+    def schedule(self) -> None:
+        deadline = self.start_time + (self.position + 1) / self.rate
+        delay = round((deadline - time.perf_counter()) * 1000)
+        self.job = self.canvas.after(max(delay, 0), self.tick)
+
+    def tick(self) -> None:
+        now = time.perf_counter()
+        rate = self.fps()
+        if rate != self.rate:
+            # speed changed, the new one counts from the current frame
+            self.start_time = now - self.position / rate
+            self.rate = rate
+        due = int((now - self.start_time) * rate)
+        if due > self.position:
+            self.dropped += due - self.position - 1
+            self.position = due
+            self.showFrame(due)
+            self.window_shown += 1
+            self.show_cost += time.perf_counter() - now
+        if now - self.window_start >= self.STATS_INTERVAL:
+            self.on_stats('%.1f fps, %d dropped, render %.2f ms/frame, '
+                          'show %.2f ms/frame' % (
+                              self.window_shown / (now - self.window_start),
+                              self.dropped, self.render_cost * 1000,
+                              self.show_cost * 1000 /
+                              max(self.window_shown, 1)))
+            self.window_start = now
+            self.window_shown = 0
+            self.show_cost = 0.0
+        self.schedule()
+
+
+class AssetLoader:
+    '''Runs the calls of one load on a worker pool and hands the results
+    back through the Tk event loop.
+
+    Finished calls are collected by an after() poll and passed on in
+    batches, in call order, so the callbacks run on the Tk thread. Starting
+    a load cancels the previous one: its calls that haven't started are
+    dropped from the pool, results of running ones are ignored.'''
+
+    POLL_MS = 20
+
+    def __init__(self, widget: tk.Misc, pool: Callable[[], Executor],
+                 on_progress: Callable[[str], None]) -> None:
+        self.widget = widget
+        self.pool = pool
+        self.on_progress = on_progress
+        self.futures: List[Future] = []
+        # index of the first result not passed on yet
+        self.next = 0
+        self.job: Optional[str] = None
+
+    @property
+    def busy(self) -> bool:
+        return bool(self.futures)
+
+    def load(self, name: str, function: Callable, calls: List[Tuple],
+             on_batch: Callable[[List], None],
+             on_done: Callable[[], None]) -> None:
+        '''Runs function(*args) for every args in calls. on_batch gets the
+        results as they come in, on_done follows the last batch.'''
+        self.cancel()
+        self.name = name
+        self.on_batch = on_batch
+        self.on_done = on_done
+        self.start_time = time.perf_counter()
+        executor = self.pool()
+        self.futures = [
+            executor.submit(parallel.call, function, *args) for args in calls
+        ]
+        self.next = 0
+        self.poll()
+
+    def cancel(self) -> None:
+        for future in self.futures[self.next:]:
+            future.cancel()
+        self.futures = []
+        if self.job is not None:
+            self.widget.after_cancel(self.job)
+            self.job = None
+        self.on_progress('')
+
+    def poll(self) -> None:
+        self.job = None
+        results = []
+        try:
+            while self.next < len(self.futures) and \
+                    self.futures[self.next].done():
+                results.append(self.futures[self.next].result())
+                self.next += 1
+        except Exception as e:
+            self.cancel()
+            error = '%s: %s' % (self.name, e if isinstance(
+                e, parallel.WorkerError) else '%s: %s' % (type(e).__name__, e))
+            log.error('%s', error)
+            self.on_progress(error)
+            return
+        if results:
+            self.on_batch(results)
+        if self.next < len(self.futures):
+            self.on_progress('loading %s %d/%d' % (self.name, self.next,
+                                                  len(self.futures)))
+            self.job = self.widget.after(self.POLL_MS, self.poll)
+            return
+        log.debug('%s: %d parts loaded in %.2fs', self.name,
+                  len(self.futures), time.perf_counter() - self.start_time)
+        self.futures = []
+        self.on_progress('')
+        self.on_done()
+
+
+class Prefetcher:
+    '''Decodes the files around the selected one into a DecodedCache while
+    the GUI has nothing else to load.
+
+    Files go one at a time to a single worker with lowered priority, and
+    only while busy() is false, so a foreground load never waits for them.
+    A new selection replaces the queue; the file in flight is finished and
+    kept only if it is still wanted.'''
+
+    POLL_MS = 50
+    # files read ahead and behind the selection
+    DISTANCE = 3
+    NICE = 10
+
+    def __init__(self, widget: tk.Misc, cache: decodedcache.DecodedCache,
+                 busy: Callable[[], bool]) -> None:
+        self.widget = widget
+        self.cache = cache
+        self.busy = busy
+        self.executor: Optional[Executor] = None
+        self.queue: List[str] = []
+        self.wanted: set = set()
+        # files that failed to decode, left to the foreground load to report
+        self.failed: set = set()
+        self.future: Optional[Future] = None
+        self.key: Optional[decodedcache.FileKey] = None
+        self.job: Optional[str] = None
+
+    def prefetch(self, paths: List[str]) -> None:
+        '''Replaces the queue with paths, most wanted first.'''
+        self.queue = list(paths)
+        self.wanted = set(os.path.abspath(path) for path in paths)
+        self.schedule()
+
+    def cancel(self) -> None:
+        self.queue = []
+        self.wanted = set()
+        if self.future is not None and self.future.cancel():
+            self.future = None
+
+    def shutdown(self) -> None:
+        self.cancel()
+        if self.job is not None:
+            self.widget.after_cancel(self.job)
+            self.job = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    def schedule(self) -> None:
+        if self.job is None:
+            self.job = self.widget.after(self.POLL_MS, self.step)
+
+    def step(self) -> None:
+        self.job = None
+        if self.future is not None:
+            if not self.future.done():
+                self.schedule()
+                return
+            self.collect()
+        if not self.queue:
+            return
+        if self.busy():
+            self.schedule()
+            return
+        while self.queue:
+            path = self.queue.pop(0)
+            try:
+                key = decodedcache.fileKey(path)
+            except OSError:
+                continue
+            if key in self.cache or key in self.failed:
+                continue
+            if self.executor is None:
+                cache = assetcache.default_cache
+                self.executor = parallel.createExecutor(
+                    1, cache.directory if cache else None, self.NICE)
+            self.key = key
+            self.future = self.executor.submit(
+                parallel.call, decodedcache.decodeFile, path)
+            self.schedule()
+            return
 
+    def collect(self) -> None:
+        future, self.future = self.future, None
+        try:
+            decoded = future.result()
+        except Exception:
+            self.failed.add(self.key)
+            return
+        if self.key[0] in self.wanted:
+            self.cache.put(self.key, decoded, prefetched=True)
 
-def getPaletteFromSprites(sprites: List[gatypes.SpriteDescriptor]) -> int:
-    return max(map(lambda s: min(s.data), sprites)) & 0xF0
 
 class Application(tk.Frame):
     def __init__(self, master=None) -> None:
@@ -144,87 +616,216 @@ class Application(tk.Frame):
 
         self.palette_start_index = -1
         self.input_type = InputType.NONE
-        self.photos: List[ImageTk.PhotoImage] = []
+        # indexed images on the canvas and their photos, recolored in place
+        self.photos: List[Tuple[Image.Image, ImageTk.PhotoImage]] = []
+        self.map_view: Optional[MapView] = None
+        # map of current_file, None until it is loaded
+        self.game_map: Optional[gamefiles.GameMap] = None
+        self.tiles: Optional[List[gatypes.SpriteDescriptor]] = None
+        self.map_grid: Optional[maprender.TileGrid] = None
+        self.current_file = ''
+        self.render_cache = rendercache.RenderCache()
         self.sprites: List[gatypes.SpriteDescriptor] = []
-        self.animation_thread_running = False
-        self.close_when_thread_is_finished = False
+        # indices in sprites of the sprite list rows, after filtering
+        self.sprite_rows: List[int] = []
+        self.catalog: Optional[catalog.Catalog] = None
+        # (file, sprite ids, palette index, scale) of the player's frames
+        self.animation_key: Optional[Tuple] = None
         self.grid(sticky=tk.N + tk.S + tk.E + tk.W, padx=4, pady=4)
         self.createWidgets()
+        self.sprite_layer = CanvasLayer(self.canvas)
+        self.map_layer = CanvasLayer(self.canvas)
+        self.player = AnimationPlayer(
+            CanvasLayer(self.canvas), lambda: self.speed_var.get(),
+            lambda stats: self.animation_stats.set(stats))
+        # created on first use, the catalog scan has its own smaller pool so
+        # a file load doesn't queue up behind it
+        self.executor: Optional[Executor] = None
+        self.scan_executor: Optional[Executor] = None
+        # progress text of every loader, shown together
+        self.loading: Dict[str, str] = {}
+        self.file_loader = AssetLoader(
+            self, self.pool, lambda text: self.setLoadingStatus('file', text))
+        self.catalog_loader = AssetLoader(
+            self, self.scanPool,
+            lambda text: self.setLoadingStatus('catalog', text))
+        self.decoded_cache = decodedcache.DecodedCache()
+        self.prefetcher = Prefetcher(self, self.decoded_cache,
+                                     lambda: self.file_loader.busy)
         self.master.protocol('WM_DELETE_WINDOW', lambda: self.onClose())
 
         if len(sys.argv) > 1 and sys.argv[1]:
             self.handleGameDirectoryChange(sys.argv[1])
 
+    def pool(self) -> Executor:
+        if self.executor is None:
+            cache = assetcache.default_cache
+            # one core is left to the Tk thread
+            self.executor = parallel.createExecutor(
+                max((os.cpu_count() or 2) - 1, 1),
+                cache.directory if cache else None)
+        return self.executor
+
+    def scanPool(self) -> Executor:
+        if self.scan_executor is None:
+            cache = assetcache.default_cache
+            self.scan_executor = parallel.createExecutor(
+                max((os.cpu_count() or 2) // 4, 1),
+                cache.directory if cache else None, Prefetcher.NICE)
+        return self.scan_executor
+
+    def setLoadingStatus(self, loader: str, text: str) -> None:
+        self.loading[loader] = text
+        self.loading_status.set(
+            ', '.join(text for text in self.loading.values() if text))
+
     def handleGameDirectoryChange(self, game_dir: str):
         self.game_directory = game_dir
         self.string_game_dir.set(self.game_directory)
         self.parsePalDat(self.game_directory)
-        self.loadGameDirectory(self.game_directory)
+        self.prefetcher.cancel()
+        self.catalog = catalog.Catalog(game_dir)
+        self.catalog.load()
+        stale = self.catalog.prune()
+        self.updateFileList()
+        # all files are listed right away, the details of new and changed
+        # ones come in as they are scanned
+        self.catalog_loader.load(
+            'catalog', catalog.scanFile,
+            [(os.path.join(game_dir, name), ) for name in stale],
+            lambda infos: self.onCatalogBatch(infos),
+            lambda: self.onCatalogScanned(len(stale)))
+
+    def onCatalogBatch(self, infos: List[catalog.FileInfo]) -> None:
+        self.catalog.update(infos)
+        self.updateFileList()
+
+    def onCatalogScanned(self, scanned: int) -> None:
+        if scanned:
+            self.catalog.save()
+        log.debug('catalog: %d files, %d scanned', len(self.catalog), scanned)
 
     def onClose(self) -> None:
-        if self.animation_thread_running:
-            self.close_when_thread_is_finished = True
-            self.animation_enabled.set(0)
-        else:
-            self.master.destroy()
+        self.player.stop()
+        self.file_loader.cancel()
+        self.catalog_loader.cancel()
+        self.prefetcher.shutdown()
+        for executor in (self.executor, self.scan_executor):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        self.master.destroy()
 
     def parsePalDat(self, filename: str) -> None:
         try:
-            self.pal_dat = palettes.Palettes.from_file(
-                os.path.join(filename, 'pal.dat'))
+            pals = gamefiles.loadPalettes(filename)
         except FileNotFoundError as e:
             messagebox.showerror('Error', str(e))
             return
-        pals = []
-        i = 0
-        for p in self.pal_dat.palettes:
-            pals.append(gatypes.Palette([gatypes.Color(
-                int(c.r*graph_util.MULT), int(c.g*graph_util.MULT), int(c.b*graph_util.MULT)) for c in p.colors], i, p.palette_start_index))
-            i += 1
         self.lb_palettes.setPalettes(pals)
         self.lb_palettes.updatePalettesListBox(0)
 
-    def parseSprFile(self, spr_filename: str) -> None:
-        self.sprites.clear()
+    def clearSpriteList(self) -> None:
+        self.sprites = []
+        self.sprite_rows = []
         #self.checkbox_render_all.deselect()
         self.lb_sprites.listbox.configure(state=tk.NORMAL)
         self.lb_sprites.listbox.delete(0, tk.END)
-        self.chrfile = goldenaxe_parser.GoldenaxeParser.from_file(spr_filename)
-        i = 0
-        for ss in self.chrfile.sprites:
-            if not ss.size:
-                continue
-            for s in ss.data.sprite:
-                if len(s.sprite_data) < s.width*s.height:
-                    print('output too short, extending:',
-                          s.width*s.height - len(s.sprite_data))
-                    s.sprite_data.extend(
-                        [0]*(s.width*s.height - len(s.sprite_data)))
-                sprite = gatypes.SpriteDescriptor(
-                    i, s.width, s.height, 0, 0, s.sprite_data)
-                self.sprites.append(sprite)
-                self.lb_sprites.listbox.insert(tk.END, '%06x (%d, %d)' % (
-                    sprite.id, sprite.width, sprite.height))
-                i += 1
-        self.onRenderAllChange()
 
-    def parseChrFile(self, chr_filename: str) -> None:
-        self.sprites.clear()
-        #self.checkbox_render_all.deselect()
+    def addSprites(self, sprites: List[gatypes.SpriteDescriptor]) -> None:
+        '''Appends a batch of decoded sprites to the sprite list.'''
+        first = len(self.sprites)
+        self.sprites.extend(sprites)
+        query = self.sprite_query.get()
+        rows = [
+            first + i for i, s in enumerate(sprites)
+            if catalog.spriteMatches(query, s.id, s.width, s.height)
+        ]
+        self.sprite_rows.extend(rows)
+        # a disabled listbox ignores inserts
+        state = self.lb_sprites.listbox.cget('state')
         self.lb_sprites.listbox.configure(state=tk.NORMAL)
-        self.lb_sprites.listbox.delete(0, tk.END)
-        self.chrfile = lzwfile.Lzwfile.from_file(chr_filename)
-        i = 0
-        cur_pos = 0
-        while cur_pos < len(self.chrfile.raw) - 64:
-            sprite = gatypes.SpriteDescriptor(i, 8, 8, 0, 0, bytearray(
-                [p if p else p for p in self.chrfile.raw[cur_pos:cur_pos+64]]))
-            self.sprites.append(sprite)
-            self.lb_sprites.listbox.insert(tk.END, '%06x (%d, %d)' % (
-                sprite.id, sprite.width, sprite.height))
-            i += 1
-            cur_pos += 64
-        self.onRenderAllChange()
+        self.lb_sprites.listbox.insert(tk.END, *[
+            '%06x (%d, %d)' % (self.sprites[i].id, self.sprites[i].width,
+                               self.sprites[i].height) for i in rows
+        ])
+        self.lb_sprites.listbox.configure(state=state)
+
+    def updateSpriteList(self) -> None:
+        sprites = self.sprites
+        self.clearSpriteList()
+        self.addSprites(sprites)
+
+    def sprEntryTasks(self, spr_filename: str) -> List[Tuple]:
+        name = os.path.basename(spr_filename)
+        if self.catalog and self.catalog.isCurrent(name) and \
+                not self.catalog.files[name].error:
+            tasks = self.catalog.spriteEntryTasks(self.catalog.files[name])
+        else:
+            tasks = parallel.spriteEntryTasks(spr_filename)
+        return [(task, ) for task in tasks]
+
+    def lookupDecoded(
+        self, filename: str
+    ) -> Tuple[Optional[decodedcache.FileKey],
+               Optional[decodedcache.DecodedFile]]:
+        try:
+            key = decodedcache.fileKey(filename)
+        except OSError:
+            return None, None
+        return key, self.decoded_cache.get(key)
+
+    def storeDecoded(self, key: Optional[decodedcache.FileKey],
+                     decoded: decodedcache.DecodedFile) -> None:
+        if key is not None:
+            self.decoded_cache.put(key, decoded)
+
+    def parseSprFile(self, spr_filename: str) -> None:
+        key, decoded = self.lookupDecoded(spr_filename)
+        if decoded is not None:
+            self.addSprites(parallel.toSpriteDescriptors(decoded.entries))
+            self.onRenderAllChange()
+            return
+        name = os.path.basename(spr_filename)
+        try:
+            calls = self.sprEntryTasks(spr_filename)
+        except Exception as e:
+            # reported like errors of the load itself
+            error = '%s: %s: %s' % (name, type(e).__name__, e)
+            log.error('%s', error)
+            self.setLoadingStatus('file', error)
+            return
+        decoded = decodedcache.DecodedFile('spr')
+
+        def addEntries(entries: List[parallel.DecodedEntry]) -> None:
+            decoded.entries.extend(entries)
+            self.addSprites(parallel.toSpriteDescriptors(
+                entries, len(self.sprites)))
+
+        def done() -> None:
+            self.storeDecoded(key, decoded)
+            self.onRenderAllChange()
+
+        self.file_loader.load(name, parallel.decodeSpriteEntry, calls,
+                              addEntries, done)
+
+    def parseChrFile(self, chr_filename: str) -> None:
+        key, decoded = self.lookupDecoded(chr_filename)
+        if decoded is not None:
+            self.setTiles(decoded.tiles)
+            self.onRenderAllChange()
+            return
+
+        def setTiles(tile_sets: List[maprender.TileSet]) -> None:
+            self.storeDecoded(key, decodedcache.DecodedFile(
+                'chr', tiles=tile_sets[0]))
+            self.setTiles(tile_sets[0])
+
+        self.file_loader.load(
+            os.path.basename(chr_filename), gamefiles.loadTileSet,
+            [(chr_filename, )], setTiles, lambda: self.onRenderAllChange())
+
+    def setTiles(self, tiles: maprender.TileSet) -> None:
+        self.addSprites(gamefiles.tileSprites(tiles))
 
     '''
 {0, 9, 10, 17, 18}
@@ -238,79 +839,103 @@ class Application(tk.Frame):
     '''
 
     def renderMap(self) -> None:
-        if not self.tiles:
+        if not self.tiles or self.map_grid is None:
             return
-        min_color = getPaletteFromSprites(self.tiles)
+        min_color = gamefiles.paletteStartIndex(self.tiles)
         print('palette:', hex(min_color))
         self.lb_palettes.updatePalettesListBox(min_color)
         selected_palette = self.lb_palettes.getSelectedPalette()
         self.paletet_frame.updatePaletteFrame(selected_palette)
 
-        map_img = Image.new(
-            "RGB", (self.map_width*8, self.map_height*8), color=(255, 255, 255))
-
         self.canvas.update()
-        current_y = 0
-        tile_types = set()
-        for y in range(0, self.map_height):
-            current_x = 0
-            for x in range(0, self.map_width):
-                tile = self.map_data[y*self.map_width + x]
-                tile_index = (tile & 0x07FF) >> 1
-                if tile_index >= len(self.tiles):
-                    print('unknown tile:', hex(tile_index), x, y)
-                    tile_index = 0
-                colored_tile = graph_util.ApplyPalette(
-                    self.tiles[tile_index].data, selected_palette)
-                img = Image.frombuffer(
-                    'RGB', (self.tiles[tile_index].width, self.tiles[tile_index].height), colored_tile, 'raw', 'RGB', 0, 1)
-                #draw = ImageDraw.Draw(img)
-                #draw.text((0,0), str(tile>>11), ((tile>>11)*8, 0, 255))
-                #img.putpixel((0,0), ((tile>>11)*8, 0, 0))
-                tile_types.add(tile >> 11)
-                map_img.paste(img, box=(current_x, current_y))
-                current_x += 8
-            current_y += 8
-
-        print(tile_types)
-        scale = self.scale_slider.get()
-        self.map_img = map_img.resize(
-            (round(self.map_width * 8 * scale), round(self.map_height * 8 * scale)))
-        self.photos = [ImageTk.PhotoImage(self.map_img), ]
-        self.canvas.create_image(x, y, image=self.photos[-1], anchor=tk.NW)
-        # map_img.close()
+        # keep the relative scroll position when the scale changes
+        view_x = self.canvas.xview()[0]
+        view_y = self.canvas.yview()[0]
+        if self.map_view:
+            self.map_view.destroy()
+        self.clearSprites()
+        self.map_view = MapView(self.map_layer, self.map_grid,
+                                self.scale_slider.get(), selected_palette,
+                                self.render_cache, self.current_file)
+        self.canvas.xview_moveto(view_x)
+        self.canvas.yview_moveto(view_y)
+        self.map_view.update()
+        self.logRenderStats()
+
+    def closeMapView(self) -> None:
+        if not self.map_view:
+            return
+        self.map_view.destroy()
+        self.map_view = None
+        self.map_layer.clear()
+        self.canvas.configure(scrollregion=(0, 0, 0, 0))
+        self.canvas.xview_moveto(0)
+        self.canvas.yview_moveto(0)
+
+    def onCanvasScroll(self, view: Callable, *args) -> None:
+        view(*args)
+        if self.map_view:
+            self.map_view.update()
+
+    def onCanvasDragStart(self, event) -> None:
+        if self.map_view:
+            self.canvas.scan_mark(event.x, event.y)
+
+    def onCanvasDrag(self, event) -> None:
+        if self.map_view:
+            self.canvas.scan_dragto(event.x, event.y, gain=1)
+            self.map_view.update()
+
+    def onCanvasWheel(self, event) -> None:
+        if not self.map_view:
+            return
+        if event.num == 4 or event.delta > 0:
+            self.onCanvasScroll(self.canvas.yview, 'scroll', -1, 'units')
+        else:
+            self.onCanvasScroll(self.canvas.yview, 'scroll', 1, 'units')
+
+    def onCanvasConfigure(self, event) -> None:
+        if self.map_view:
+            self.map_view.update()
 
     def parseMapFile(self, map_filename: str) -> None:
-        self.sprites.clear()
-        self.tiles = []
-        #self.checkbox_render_all.deselect()
-        self.lb_sprites.listbox.configure(state=tk.NORMAL)
-        self.lb_sprites.listbox.delete(0, tk.END)
-        self.mapfile = lzwfile.Lzwfile.from_file(map_filename)
-        self.chrfile = lzwfile.Lzwfile.from_file(map_filename[:-4] + '.CHR')
-        i = 0
-        cur_pos = 0
-        while cur_pos < len(self.chrfile.raw) - 64:
-            tile = gatypes.SpriteDescriptor(i, 8, 8, 0, 0, bytearray(
-                [p if p else p for p in self.chrfile.raw[cur_pos:cur_pos+64]]))
-            self.tiles.append(tile)
-            i += 1
-            cur_pos += 64
-        self.map_width: int = gatypes.STRUCT_USHORT_unpack(self.mapfile.raw[0:2])[
-            0]
-        self.map_height: int = gatypes.STRUCT_USHORT_unpack(self.mapfile.raw[2:4])[
-            0]
-        self.map_data: List[int] = [gatypes.STRUCT_USHORT_unpack(
-            self.mapfile.raw[4 + i*2: 4 + i*2 + 2])[0] for i in range(0, self.map_height*self.map_width)]
+        key, decoded = self.lookupDecoded(map_filename)
+        if decoded is not None:
+            self.setGameMap(decoded.game_map)
+            return
+
+        def setGameMap(maps: List[gamefiles.GameMap]) -> None:
+            self.storeDecoded(key, decodedcache.DecodedFile(
+                'map', game_map=maps[0]))
+            self.setGameMap(maps[0])
+
+        self.file_loader.load(
+            os.path.basename(map_filename), gamefiles.loadMapFile,
+            [(map_filename, )], setGameMap, lambda: None)
+
+    def setGameMap(self, game_map: gamefiles.GameMap) -> None:
+        self.game_map = game_map
+        self.tiles = gamefiles.tileSprites(self.game_map.tiles)
+        if self.tiles:
+            self.map_grid = self.game_map.grid()
+            for x, y, tile_index in self.map_grid.unknown_tiles:
+                print('unknown tile:', hex(tile_index), x, y)
+            print(set(tile >> 11 for tile in self.game_map.cells))
         self.renderMap()
 
-    def loadGameDirectory(self, directory: str):
-        (_, _, filenames) = next(os.walk(directory))
-        self.lb_files.listbox.delete(0, tk.END)
-        for fn in filenames:
-            if not isSupportedExt(fn):
-                continue
-            self.lb_files.listbox.insert(tk.END, fn)
+    def updateFileList(self) -> None:
+        listbox = self.lb_files.listbox
+        selected = self.getSelectedFile() if listbox.curselection() else None
+        listbox.delete(0, tk.END)
+        # an empty catalog is still a catalog, its files aren't scanned yet
+        if self.catalog is None:
+            return
+        for info in self.catalog.search(self.file_query.get()):
+            listbox.insert(tk.END, info.name)
+            if info.name == selected:
+                # the list is rebuilt as scanned files come in, maybe while
+                # the file is open
+                listbox.selection_set(tk.END)
 
     def loadPalDat(self, event):
         dirname = filedialog.askdirectory(mustexist=True)
@@ -318,6 +943,17 @@ class Application(tk.Frame):
             self.handleGameDirectoryChange(dirname)
 
     def loadGameFile(self, filename: str) -> None:
+        '''Shows filename right away when it is in the decoded cache, else
+        starts loading it on the worker pool, whatever was still loading is
+        cancelled. The files around it are prefetched.'''
+        self.file_loader.cancel()
+        self.closeMapView()
+        self.clearSpriteList()
+        # nothing renders the previous map under the new file's name
+        self.game_map = None
+        self.tiles = None
+        self.map_grid = None
+        self.current_file = filename
         extension = pathlib.Path(filename).suffix.lower()
         if extension == '.spr':
             self.input_type = InputType.SPR_FILE
@@ -328,6 +964,20 @@ class Application(tk.Frame):
         elif extension == '.map':
             self.input_type = InputType.MAP_FILE
             self.parseMapFile(filename)
+        log.debug('%s', self.decoded_cache)
+        self.prefetchNeighbours()
+
+    def prefetchNeighbours(self) -> None:
+        listbox = self.lb_files.listbox
+        selection = listbox.curselection()
+        if not selection:
+            return
+        names = listbox.get(0, tk.END)
+        self.prefetcher.prefetch([
+            os.path.join(self.game_directory, names[i])
+            for i in decodedcache.neighbours(selection[0], len(names),
+                                             Prefetcher.DISTANCE)
+        ])
 
     def getScaledSpriteSize(
             self, sprite: gatypes.SpriteDescriptor) -> gatypes.ImageSize:
@@ -335,27 +985,54 @@ class Application(tk.Frame):
         return gatypes.ImageSize(round(sprite.width * scale),
                                  round(sprite.height * scale))
 
-    def drawBytesOnCanvas(self, img_buffer: bytearray, width: int, height: int,
-                          x: int, y: int,
-                          palette: gatypes.Palette) -> gatypes.ImageSize:
-        colored_sprite = graph_util.ApplyPalette(img_buffer, palette)
-        scale = self.scale_slider.get()
-        img = Image.frombuffer('RGB', (width, height), colored_sprite, 'raw',
-                               'RGB', 0, 1).resize((round(width * scale),
-                                                    round(height * scale)))
+    def drawImageOnCanvas(self, img: Image.Image, x: int,
+                          y: int) -> gatypes.ImageSize:
         if x == 0 and y == 0:
             self.photos = []
-        self.photos.append(ImageTk.PhotoImage(img))
-        self.canvas.create_image(x, y, image=self.photos[-1], anchor=tk.NW)
-        r = gatypes.ImageSize(*img.size)
-        img.close()
-        return r
+        key = len(self.photos)
+        photo = self.sprite_layer.photo(key)
+        if photo is not None and (photo.width(), photo.height()) == img.size:
+            # same size as what was drawn here last time, only the pixels
+            # are replaced
+            photo.paste(img)
+        else:
+            photo = ImageTk.PhotoImage(img)
+        self.photos.append((img, photo))
+        self.sprite_layer.show(key, x, y, photo)
+        return gatypes.ImageSize(*img.size)
+
+    def clearSprites(self) -> None:
+        self.photos = []
+        self.sprite_layer.clear()
+
+    def logRenderStats(self) -> None:
+        if not log.isEnabledFor(logging.DEBUG):
+            return
+        log.debug('%s', self.render_cache)
+        layers = (self.sprite_layer, self.map_layer, self.player.layer)
+        log.debug('canvas: %d items (sprites %d, map %d, animation %d), '
+                  '%d photos', len(self.canvas.find_all()),
+                  *(layer.itemCount() for layer in layers),
+                  self.sprite_layer.photoCount() +
+                  self.map_layer.photoCount() + len(self.player.photos))
+
+    def recolorCanvas(self, palette: gatypes.Palette) -> None:
+        '''Palette swap of everything on the canvas, nothing is re-rendered.'''
+        for img, photo in self.photos:
+            graph_util.SetImagePalette(img, palette)
+            photo.paste(img)
+        if self.map_view:
+            self.map_view.setPalette(palette)
 
     def drawSpriteOnCanvas(self, sprite: gatypes.SpriteDescriptor, x: int,
                            y: int,
                            palette: gatypes.Palette) -> gatypes.ImageSize:
-        return self.drawBytesOnCanvas(sprite.data, sprite.width, sprite.height,
-                                      x, y, palette)
+        img = graph_util.CachedSpriteImage(self.render_cache,
+                                           self.current_file, sprite,
+                                           self.scale_slider.get())
+        # cached images are shared, the palette is set on every use
+        graph_util.SetImagePalette(img, palette)
+        return self.drawImageOnCanvas(img, x, y)
 
     def renderSpriteList(self,
                          sprites: List[gatypes.SpriteDescriptor]) -> None:
@@ -364,7 +1041,7 @@ class Application(tk.Frame):
             return
         if not sprites:
             return
-        min_color = getPaletteFromSprites(sprites)
+        min_color = gamefiles.paletteStartIndex(sprites)
         print('palette:', hex(min_color))
         #self.updatePaletteFrame()
         self.lb_palettes.updatePalettesListBox(min_color)
@@ -384,71 +1061,102 @@ class Application(tk.Frame):
             current_x += actual_size.width
             if actual_size.height > max_height:
                 max_height = actual_size.height
+        # whatever the previous render drew past the last sprite goes away
+        self.sprite_layer.retain(range(len(self.photos)))
+        self.sprite_layer.trim()
+        self.logRenderStats()
 
     def renderAllSprites(self) -> None:
-        self.renderSpriteList(self.sprites)
+        self.renderSpriteList(self.visibleSprites())
 
     def getSelectedFile(self) -> str:
         return self.lb_files.listbox.get(self.lb_files.listbox.curselection())
 
+    def visibleSprites(self) -> List[gatypes.SpriteDescriptor]:
+        return [self.sprites[i] for i in self.sprite_rows]
+
     def getSelectedSprites(self) -> List[gatypes.SpriteDescriptor]:
         if self.render_all.get():
-            return self.sprites
+            return self.visibleSprites()
         else:
             selected_sprites = self.lb_sprites.listbox.curselection()
-            return [self.sprites[i] for i in selected_sprites]
-
-    def animate(self, sprites: List[gatypes.SpriteDescriptor]) -> None:
-        self.animation_thread_running = True
-        clipping_box = graph_util.CalculateClippingBox(sprites)
-
-        sprite_index = 0
-        while self.animation_enabled.get():
-            if sprites:
-                s = sprites[sprite_index]
-                buf = graph_util.AddClippingBox(s, clipping_box, 0xFF)
-                self.drawBytesOnCanvas(buf, clipping_box.width,
-                                       clipping_box.height, 0, 0,
-                                       self.lb_palettes.getSelectedPalette())
-                sprite_index += 1
-                sprite_index %= len(sprites)
-            time.sleep(1.0 / self.speed_var.get())
-        self.animation_thread_running = False
+            return [self.sprites[self.sprite_rows[i]] for i in selected_sprites]
+
+    def updateAnimationFrames(self) -> bool:
+        '''Renders the frames of the selected sprites for the player, unless
+        it already has them for this palette and scale.'''
+        sprites = self.getSelectedSprites()
+        if not sprites:
+            return False
+        palette = self.lb_palettes.getSelectedPalette()
+        scale = self.scale_slider.get()
+        key = (self.current_file, tuple(s.id for s in sprites), palette.index,
+               scale)
+        if key == self.animation_key:
+            return True
+        start = time.perf_counter()
+        frames = graph_util.FrameSet(sprites)
+        size = (round(frames.width * scale), round(frames.height * scale))
+        photos = [
+            ImageTk.PhotoImage(
+                graph_util.IndexedImage(f, frames.width, frames.height,
+                                        palette).resize(size, Image.NEAREST))
+            for f in frames
+        ]
+        self.player.setFrames(photos, time.perf_counter() - start)
+        self.animation_key = key
+        return True
 
     def animateSprites(self) -> None:
-        selected_sprites = self.getSelectedSprites()
-        if not selected_sprites:
+        self.player.stop()
+        if not self.updateAnimationFrames():
             return
-        self.current_sprite_animation_index = 0
-        self.animation_thread = Thread(
-            target=lambda: self.animate(selected_sprites))
-        self.animation_thread.start()
+        self.clearSprites()
+        self.player.start()
 
     def onFileSelect(self, event) -> None:
+        if not self.lb_files.listbox.curselection():
+            # the selection went away with a new search
+            return
         filename = os.path.join(self.game_directory, self.getSelectedFile())
         self.loadGameFile(filename)
 
     def onPaletteSelect(self, event) -> None:
-        self.paletet_frame.updatePaletteFrame(self.lb_palettes.getSelectedPalette())
-        if not self.animation_enabled.get():
-            self.renderSpriteList(self.getSelectedSprites())
+        palette = self.lb_palettes.getSelectedPalette()
+        self.paletet_frame.updatePaletteFrame(palette)
+        if self.player.running:
+            self.updateAnimationFrames()
+        else:
+            self.recolorCanvas(palette)
 
     def onSpriteSelect(self, event) -> None:
+        if self.animation_enabled.get():
+            self.animateSprites()
+            return
         sprites = self.getSelectedSprites()
         self.renderSpriteList(sprites)
 
     def onScaleChange(self) -> None:
-        if not self.animation_enabled.get():
+        if self.player.running:
+            self.updateAnimationFrames()
+        elif not self.animation_enabled.get():
             self.renderSpriteList(self.getSelectedSprites())
 
     def onRenderAllChange(self) -> None:
         if self.render_all.get():
             self.lb_sprites.listbox.configure(state=tk.DISABLED)
-            self.renderAllSprites()
+            if self.animation_enabled.get():
+                self.animateSprites()
+            else:
+                self.renderAllSprites()
         else:
             self.lb_sprites.listbox.configure(state=tk.NORMAL)
             self.onSpriteSelect(None)
 
+    def onSpriteQueryChange(self) -> None:
+        self.updateSpriteList()
+        self.onRenderAllChange()
+
     def onMultiSelectChange(self) -> None:
         if self.multiple_selection_enabled.get():
             self.lb_sprites.listbox.configure(selectmode=tk.MULTIPLE)
@@ -464,23 +1172,33 @@ class Application(tk.Frame):
         if self.animation_enabled.get():
             self.animateSprites()
         else:
+            self.player.stop()
+            self.animation_stats.set('')
             self.renderSpriteList(self.getSelectedSprites())
 
     def saveStatic(self, filename: str) -> None:
         if self.input_type == InputType.MAP_FILE:
-            img = self.map_img
+            if self.map_view is None:
+                # still loading
+                return
+            img = self.map_view.image()
         else:
             sprites = self.getSelectedSprites()
             palette = self.lb_palettes.getSelectedPalette()
-            img = graph_util.GetSpritesImage(sprites, palette)
+            img = graph_util.GetSpritesImage(sprites, palette,
+                                             cache=self.render_cache,
+                                             filename=self.current_file)
         try:
             img.save(filename)
         except ValueError as e:
             messagebox.showerror('Error', str(e))
 
     def onSave(self) -> None:
+        filetypes = [('PNG files.', '*.png'), ('GIF files.', '*.gif')]
+        if self.animation_enabled.get():
+            filetypes.append(('WebP files.', '*.webp'))
         filename = filedialog.asksaveasfilename(
-            filetypes=(('PNG files.', '*.png'), ('GIF files.', '*.gif')),
+            filetypes=filetypes,
             initialdir=self.game_directory)
         if self.animation_enabled.get():
             result, error = graph_util.SaveAnimatedImage(filename, self.getSelectedSprites(
@@ -506,6 +1224,10 @@ class Application(tk.Frame):
         self.text_pal_dat.grid(column=0, row=1, columnspan=2, sticky='NEW')
         self.text_pal_dat.bind("<Button-1>", lambda e: self.loadPalDat(e))
 
+        self.loading_status = tk.StringVar()
+        self.label_loading = tk.Label(self, textvariable=self.loading_status)
+        self.label_loading.grid(column=1, row=0, sticky='NE')
+
         self.pal_sprites_frame = tk.Frame(self)
         self.pal_sprites_frame.grid(column=0, row=2, rowspan=3, sticky='NESW')
         self.pal_sprites_frame.rowconfigure(1, weight=1)
@@ -520,9 +1242,43 @@ class Application(tk.Frame):
         self.lb_sprites = CustomListbox(
             'Sprites:', self.pal_sprites_frame, lambda e: self.onSpriteSelect(e), 2)
 
-        self.canvas = tk.Canvas(self, bg='#FFFFFF')
-        self.canvas.grid(column=1, row=2, columnspan=3, sticky='NESW')
-        self.canvas_image = Image.new("RGB", (0, 0), color=(255, 255, 255))
+        # name, spr/chr/map or a WxH sprite size, * for any
+        self.file_query = tk.StringVar()
+        self.file_query.trace_add('write', lambda *args: self.updateFileList())
+        self.entry_file_query = tk.Entry(self.pal_sprites_frame,
+                                         textvariable=self.file_query)
+        self.entry_file_query.grid(column=0, row=2, sticky='EW')
+        # hex id prefix or WxH
+        self.sprite_query = tk.StringVar()
+        self.sprite_query.trace_add('write',
+                                    lambda *args: self.onSpriteQueryChange())
+        self.entry_sprite_query = tk.Entry(self.pal_sprites_frame,
+                                           textvariable=self.sprite_query)
+        self.entry_sprite_query.grid(column=4, row=2, sticky='EW')
+
+        self.canvas_frame = tk.Frame(self)
+        self.canvas_frame.grid(column=1, row=2, columnspan=3, sticky='NESW')
+        self.canvas_frame.rowconfigure(0, weight=1)
+        self.canvas_frame.columnconfigure(0, weight=1)
+        self.canvas = tk.Canvas(self.canvas_frame, bg='#FFFFFF')
+        self.canvas.grid(column=0, row=0, sticky='NESW')
+        self.canvas_xscroll = tk.Scrollbar(
+            self.canvas_frame, orient=tk.HORIZONTAL,
+            command=lambda *args: self.onCanvasScroll(self.canvas.xview, *args))
+        self.canvas_xscroll.grid(column=0, row=1, sticky='EW')
+        self.canvas_yscroll = tk.Scrollbar(
+            self.canvas_frame, orient=tk.VERTICAL,
+            command=lambda *args: self.onCanvasScroll(self.canvas.yview, *args))
+        self.canvas_yscroll.grid(column=1, row=0, sticky='NS')
+        self.canvas.configure(xscrollcommand=self.canvas_xscroll.set,
+                              yscrollcommand=self.canvas_yscroll.set,
+                              scrollregion=(0, 0, 0, 0))
+        self.canvas.bind('<ButtonPress-1>', lambda e: self.onCanvasDragStart(e))
+        self.canvas.bind('<B1-Motion>', lambda e: self.onCanvasDrag(e))
+        self.canvas.bind('<MouseWheel>', lambda e: self.onCanvasWheel(e))
+        self.canvas.bind('<Button-4>', lambda e: self.onCanvasWheel(e))
+        self.canvas.bind('<Button-5>', lambda e: self.onCanvasWheel(e))
+        self.canvas.bind('<Configure>', lambda e: self.onCanvasConfigure(e))
 
         self.paletet_frame = PaletteFrame(self, 1, 3)
 
@@ -569,6 +1325,10 @@ class Application(tk.Frame):
                                      orient=tk.HORIZONTAL,
                                      variable=self.speed_var)
         self.speed_slider.grid(column=1, row=2, sticky='W')
+        self.animation_stats = tk.StringVar()
+        self.label_animation_stats = tk.Label(
+            self.control_frame, textvariable=self.animation_stats)
+        self.label_animation_stats.grid(column=1, row=1, sticky='W')
 
         self.button_save = tk.Button(self.control_frame,
                                      text='Save',
@@ -577,6 +1337,11 @@ class Application(tk.Frame):
         self.button_save.grid(column=2, row=0, rowspan=3, sticky='NES')
 
 
-app = Application()
-app.master.title('Golden Axe viewer')
-app.mainloop()
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG if os.environ.get(
+        'GOLDENAXE_DEBUG') else logging.WARNING)
+    assetcache.setDefaultCache(assetcache.AssetCache(
+        assetcache.defaultCacheDirectory()))
+    app = Application()
+    app.master.title('Golden Axe viewer')
+    app.mainloop()